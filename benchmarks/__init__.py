@@ -0,0 +1 @@
+"""Benchmarks, and the synthetic data and stand-in services they use."""
@@ -0,0 +1,247 @@
+"""
+Local stand-in for the elitebgs.app v5 API.
+
+Serves the `factions`, `systems` and `ticks` endpoints from a synthetic
+`Galaxy`, or from recorded responses, with configurable latency and error
+rate.  Point `EliteBGS` at it with `base_url`, or `elitebgs: base_url:` in
+the configuration.
+
+Recorded responses are looked for as `<directory>/<endpoint>/<name>.json`,
+e.g. `recorded/systems/Sol.json`, holding the whole API response.  Anything
+not recorded comes from the galaxy.
+
+Run standalone with:
+
+    python -m benchmarks.fake_elitebgs --port 8080 --systems 1000
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.galaxy import Galaxy, timestamp
+
+API_PATH = '/api/ebgs/v5'
+
+
+class FakeEliteBGS:
+  """Stand-in elitebgs.app API server."""
+
+  def __init__(
+    self, logger: logging.Logger, galaxy: Galaxy, latency: float = 0.0, error_rate: float = 0.0,
+    recorded: Optional[str] = None, host: str = '127.0.0.1', port: int = 0, seed: int = 0
+  ):
+    """
+    Initialise the server, but don't start it yet.
+
+    :param logger: `logging.Logger` instance.
+    :param galaxy: The synthetic galaxy to serve.
+    :param latency: Seconds to delay every response.
+    :param error_rate: Proportion of requests to fail with a 429 or 503.
+    :param recorded: Optional directory of recorded responses.
+    :param host: Address to listen on.
+    :param port: Port to listen on, default any free one.
+    :param seed: Random seed for the errors.
+    """
+    self.logger = logger
+    self.galaxy = galaxy
+    self.latency = latency
+    self.error_rate = error_rate
+    self.recorded = recorded
+
+    self.rng = random.Random(seed)
+    self.lock = threading.Lock()
+    self.requests = 0
+    self.errors = 0
+
+    self.server = ThreadingHTTPServer((host, port), _Handler)
+    self.server.daemon_threads = True
+    self.server.fake = self  # type: ignore
+    self.thread: Optional[threading.Thread] = None
+
+  @property
+  def base_url(self) -> str:
+    """The base URL to give `EliteBGS`."""
+    host, port = self.server.server_address[:2]
+    if isinstance(host, bytes):
+      host = host.decode()
+
+    return f'http://{host}:{port}{API_PATH}'
+
+  def start(self) -> str:
+    """
+    Start serving, in a background thread.
+
+    :returns: The base URL.
+    """
+    self.thread = threading.Thread(target=self.server.serve_forever, name='fake-elitebgs', daemon=True)
+    self.thread.start()
+    self.logger.info(f'Fake elitebgs.app API at {self.base_url}')
+
+    return self.base_url
+
+  def stop(self) -> None:
+    """Stop serving."""
+    self.server.shutdown()
+    self.server.server_close()
+    if self.thread is not None:
+      self.thread.join()
+
+  def reset_counts(self) -> None:
+    """Zero the request and error counts."""
+    with self.lock:
+      self.requests = 0
+      self.errors = 0
+
+  def _recorded(self, endpoint: str, name: str) -> Optional[bytes]:
+    """Return the recorded response for a query, if there is one."""
+    if self.recorded is None:
+      return None
+
+    try:
+      with open(os.path.join(self.recorded, endpoint, f'{name}.json'), 'rb') as f:
+        return f.read()
+
+    except OSError:
+      return None
+
+  def _factions(self, query: Dict[str, str]) -> Tuple[int, bytes]:
+    """Respond to a factions query."""
+    return self._docs('factions', query.get('name', ''), self.galaxy.faction_document)
+
+  def _systems(self, query: Dict[str, str]) -> Tuple[int, bytes]:
+    """Respond to a systems query."""
+    return self._docs('systems', query.get('name', ''), self.galaxy.system_document)
+
+  def _docs(self, endpoint: str, name: str, document: Callable[[str], Optional[dict]]) -> Tuple[int, bytes]:
+    """
+    Respond with the recorded response, else the galaxy's document, for a name.
+
+    :param endpoint: The API endpoint.
+    :param name: The name queried.
+    :param document: Renders the galaxy's document for a name.
+    :returns: (HTTP status, body)
+    """
+    body = self._recorded(endpoint, name)
+    if body is not None:
+      return 200, body
+
+    doc = document(name)
+    docs = [doc] if doc is not None else []
+    return 200, json.dumps({'docs': docs, 'total': len(docs), 'page': 1, 'pages': 1}).encode()
+
+  def _ticks(self, query: Dict[str, str]) -> Tuple[int, bytes]:
+    """Respond to a ticks query."""
+    # Newest first, and only the latest unless asked for more.
+    if 'timeMin' in query:
+      since = datetime.datetime.fromtimestamp(int(query['timeMin']) / 1000, tz=datetime.timezone.utc)
+      ticks = self.galaxy.ticks(since)[::-1]
+
+    else:
+      ticks = self.galaxy.ticks(self.galaxy.now - datetime.timedelta(days=1))[-1:]
+
+    return 200, json.dumps([{'time': timestamp(t), 'updated_at': timestamp(t)} for t in ticks]).encode()
+
+  def respond(self, url: str) -> Tuple[int, bytes]:
+    """
+    Determine the response to a request.
+
+    :param url: The request path and query.
+    :returns: (HTTP status, body)
+    """
+    with self.lock:
+      self.requests += 1
+      fail = self.rng.random() < self.error_rate
+      if fail:
+        self.errors += 1
+
+    if self.latency:
+      time.sleep(self.latency)
+
+    if fail:
+      return self.rng.choice((429, 503)), b'{"error": "synthetic failure"}'
+
+    parts = urlsplit(url)
+    query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+    endpoint = parts.path[len(API_PATH) + 1:] if parts.path.startswith(API_PATH) else ''
+
+    handlers = {
+      'factions': self._factions,
+      'systems': self._systems,
+      'ticks': self._ticks,
+    }
+    if endpoint not in handlers:
+      return 404, b'{"error": "unknown endpoint"}'
+
+    return handlers[endpoint](query)
+
+
+class _Handler(BaseHTTPRequestHandler):
+  """Request handler, deferring to the server's `FakeEliteBGS`."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self) -> None:  # noqa: N802
+    """Handle a GET request."""
+    status, body = self.server.fake.respond(self.path)  # type: ignore
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, fmt: str, *args: Any) -> None:
+    """Log requests at debug level only."""
+    self.server.fake.logger.debug(fmt % args)  # type: ignore
+
+
+def main() -> int:
+  """
+  Handle program invocation.
+
+  :returns: Exit code.
+  """
+  parser = argparse.ArgumentParser(description='Serve a fake elitebgs.app v5 API.')
+  parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+  parser.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+  parser.add_argument('--systems', type=int, default=1000, help='Number of synthetic systems.')
+  parser.add_argument('--factions', type=int, default=200, help='Number of synthetic factions.')
+  parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+  parser.add_argument('--latency', type=float, default=0.0, help='Seconds to delay each response.')
+  parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion of requests to fail.')
+  parser.add_argument('--recorded', help='Directory of recorded responses.')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO)
+  logger = logging.getLogger('fake-elitebgs')
+
+  fake = FakeEliteBGS(
+    logger,
+    Galaxy(systems=args.systems, factions=args.factions, seed=args.seed),
+    latency=args.latency,
+    error_rate=args.error_rate,
+    recorded=args.recorded,
+    host=args.host,
+    port=args.port,
+    seed=args.seed,
+  )
+  fake.start()
+  try:
+    while True:
+      time.sleep(3600)
+
+  except KeyboardInterrupt:
+    fake.stop()
+
+  return 0
+
+
+if __name__ == '__main__':
+  raise SystemExit(main())
@@ -0,0 +1,357 @@
+"""
+Synthetic galaxy of systems and factions, for benchmarks.
+
+Everything is derived from a seed, so the same arguments always produce
+the same galaxy.  It can be rendered as elitebgs.app v5 API documents, or
+written straight into the database.
+"""
+import datetime
+import random
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+
+# isort off
+if TYPE_CHECKING:
+  import ed_bgs.database as database
+# isort on
+
+STATES = (
+  'none', 'boom', 'bust', 'civilliberty', 'civilunrest', 'expansion', 'famine', 'investment',
+  'lockdown', 'outbreak', 'pirateattack', 'retreat',
+)
+CONFLICT_STATES = {'war': 'war', 'civilwar': 'civil war', 'election': 'election'}
+ALLEGIANCES = ('federation', 'empire', 'alliance', 'independent')
+ECONOMIES = (
+  '$economy_agri;', '$economy_extraction;', '$economy_hightech;', '$economy_industrial;',
+  '$economy_military;', '$economy_refinery;', '$economy_service;', '$economy_tourism;',
+)
+GOVERNMENTS = (
+  '$government_anarchy;', '$government_corporate;', '$government_cooperative;', '$government_democracy;',
+  '$government_dictatorship;', '$government_feudal;', '$government_patronage;',
+)
+SECURITIES = ('$system_security_low;', '$system_security_medium;', '$system_security_high;')
+HAPPINESS = ('$faction_happinessband1;', '$faction_happinessband2;', '$faction_happinessband3;')
+
+# Used as the elitebgs.app `_id` of systems and factions.
+ID_FORMAT = '{:024x}'
+
+
+def timestamp(when: datetime.datetime) -> str:
+  """Format a time as an elitebgs.app API timestamp."""
+  return when.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f'{when.microsecond // 1000:03d}Z'
+
+
+def naive_utc(when: datetime.datetime) -> datetime.datetime:
+  """Convert a time to naive UTC, as stored in the database."""
+  return when.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def chunks(rows: list, size: int) -> Iterator[list]:
+  """Split a list into chunks of at most `size`."""
+  for i in range(0, len(rows), size):
+    yield rows[i:i + size]
+
+
+class Galaxy:
+  """A deterministic synthetic galaxy."""
+
+  def __init__(
+    self, systems: int = 500, factions: int = 100, factions_per_system: Tuple[int, int] = (3, 8),
+    conflict_rate: float = 0.05, max_age: datetime.timedelta = datetime.timedelta(days=3),
+    now: Optional[datetime.datetime] = None, seed: int = 0
+  ):
+    """
+    Generate the galaxy.
+
+    :param systems: How many systems.
+    :param factions: How many factions.
+    :param factions_per_system: (min, max) factions present in each system.
+    :param conflict_rate: Proportion of systems with a conflict.
+    :param max_age: How old the oldest system data is.
+    :param now: Time the data ages are relative to, default now.
+    :param seed: Random seed.
+    """
+    rng = random.Random(seed)
+    if now is None:
+      now = datetime.datetime.now(tz=datetime.timezone.utc)
+
+    self.now = now
+    self.faction_names = [f'Synthetic Faction {i:05d}' for i in range(factions)]
+    self.systems: Dict[str, dict] = {}
+    self.faction_systems: Dict[str, List[str]] = {f: [] for f in self.faction_names}
+
+    for i in range(systems):
+      name = f'Synth {i:06d}'
+      members = rng.sample(self.faction_names, min(factions, rng.randint(*factions_per_system)))
+
+      # Influences must sum to 1, at the 3dp elitebgs.app gives.
+      weights = [rng.expovariate(1.0) + 0.05 for _ in members]
+      total = sum(weights)
+      influences = [round(w / total, 3) for w in weights]
+      biggest = influences.index(max(influences))
+      influences[biggest] = round(influences[biggest] + 1.0 - sum(influences), 3)
+
+      presences: Dict[str, Dict[str, Any]] = {}
+      for f, influence in zip(members, influences):
+        presences[f] = {
+          'influence': influence,
+          'state': rng.choice(STATES),
+          'happiness': rng.choice(HAPPINESS),
+          'active': sorted(set(rng.sample(STATES[1:], rng.randint(0, 2)))),
+          'pending': sorted(set(rng.sample(STATES[1:], rng.randint(0, 1)))),
+          'recovering': sorted(set(rng.sample(STATES[1:], rng.randint(0, 1)))),
+        }
+        self.faction_systems[f].append(name)
+
+      # Conflicts are between factions with similar influence.
+      conflicts = []
+      if len(members) > 1 and rng.random() < conflict_rate:
+        ranked = sorted(members, key=lambda f: presences[f]['influence'], reverse=True)
+        j = rng.randrange(len(ranked) - 1)
+        conflict_type = rng.choice(tuple(CONFLICT_STATES))
+        days = (rng.randint(0, 3), rng.randint(0, 3))
+        # Close enough to fight, and still summing to 1.
+        pair = ranked[j:j + 2]
+        total = presences[pair[0]]['influence'] + presences[pair[1]]['influence']
+        presences[pair[0]]['influence'] = round(total / 2, 3)
+        presences[pair[1]]['influence'] = round(total - presences[pair[0]]['influence'], 3)
+        for f in pair:
+          presences[f]['state'] = conflict_type
+          presences[f]['active'] = [conflict_type]
+
+        conflicts.append(
+          {
+            'type': CONFLICT_STATES[conflict_type],
+            # '' is a conflict that's over, for expire_conflicts().
+            'status': rng.choice(('active', 'active', 'pending', '')),
+            'factions': (ranked[j], ranked[j + 1]),
+            'days_won': days,
+          }
+        )
+
+      self.systems[name] = {
+        'id': ID_FORMAT.format(i + 1),
+        'name': name,
+        'system_address': 1_000_000_000 + i * 7919,
+        'x': round(rng.gauss(0.0, 1000.0), 5),
+        'y': round(rng.gauss(0.0, 100.0), 5),
+        'z': round(rng.gauss(0.0, 1000.0), 5),
+        'allegiance': rng.choice(ALLEGIANCES),
+        'primary_economy': rng.choice(ECONOMIES),
+        'secondary_economy': rng.choice(ECONOMIES),
+        'government': rng.choice(GOVERNMENTS),
+        'security': rng.choice(SECURITIES),
+        'controlling': max(members, key=lambda f: presences[f]['influence']),
+        'updated_at': now - max_age * rng.random(),
+        'presences': presences,
+        'conflicts': conflicts,
+      }
+
+  def ticks(self, since: datetime.datetime) -> List[datetime.datetime]:
+    """
+    Daily ticks, from the first after `since` up to now.
+
+    :param since: Earliest tick time.
+    :returns: Tick times, oldest first.
+    """
+    tick = self.now.replace(hour=14, minute=30, second=0, microsecond=0)
+    if tick > self.now:
+      tick -= datetime.timedelta(days=1)
+
+    ticks = []
+    while tick >= since:
+      ticks.append(tick)
+      tick -= datetime.timedelta(days=1)
+
+    return ticks[::-1]
+
+  def faction_document(self, name: str) -> Optional[dict]:
+    """
+    Render a faction as an elitebgs.app factions API 'doc'.
+
+    :param name: Name of the faction.
+    :returns: The 'doc', else `None` if there's no such faction.
+    """
+    if name not in self.faction_systems:
+      return None
+
+    faction_presence = []
+    for s_name in self.faction_systems[name]:
+      s = self.systems[s_name]
+      p = s['presences'][name]
+      faction_presence.append(
+        {
+          'system_id': s['id'],
+          'system_name': s_name,
+          'system_name_lower': s_name.lower(),
+          'state': p['state'],
+          'influence': p['influence'],
+          'happiness': p['happiness'],
+          'active_states': [{'state': state} for state in p['active']],
+          'pending_states': [{'state': state, 'trend': 0} for state in p['pending']],
+          'recovering_states': [{'state': state, 'trend': 0} for state in p['recovering']],
+          'conflicts': [],
+          'updated_at': timestamp(s['updated_at']),
+        }
+      )
+
+    return {
+      '_id': ID_FORMAT.format(0x100000 + self.faction_names.index(name)),
+      'name': name,
+      'name_lower': name.lower(),
+      'faction_presence': faction_presence,
+    }
+
+  def system_document(self, name: str) -> Optional[dict]:
+    """
+    Render a system as an elitebgs.app systems API 'doc', with faction details.
+
+    :param name: Name of the system.
+    :returns: The 'doc', else `None` if there's no such system.
+    """
+    s = self.systems.get(name)
+    if s is None:
+      return None
+
+    factions = []
+    for f, p in s['presences'].items():
+      factions.append(
+        {
+          'name': f,
+          'name_lower': f.lower(),
+          'faction_details': {
+            'name': f,
+            'faction_presence': {
+              'system_id': s['id'],
+              'state': p['state'],
+              'influence': p['influence'],
+              'happiness': p['happiness'],
+              'active_states': [{'state': state} for state in p['active']],
+              'pending_states': [{'state': state, 'trend': 0} for state in p['pending']],
+              'recovering_states': [{'state': state, 'trend': 0} for state in p['recovering']],
+            },
+          },
+        }
+      )
+
+    conflicts = []
+    for c in s['conflicts']:
+      conflicts.append(
+        {
+          'type': c['type'],
+          'status': c['status'],
+          'faction1': {'name': c['factions'][0], 'days_won': c['days_won'][0]},
+          'faction2': {'name': c['factions'][1], 'days_won': c['days_won'][1]},
+        }
+      )
+
+    return {
+      '_id': s['id'],
+      'name': name,
+      'name_lower': name.lower(),
+      'system_address': s['system_address'],
+      'x': s['x'],
+      'y': s['y'],
+      'z': s['z'],
+      'allegiance': s['allegiance'],
+      'primary_economy': s['primary_economy'],
+      'secondary_economy': s['secondary_economy'],
+      'government': s['government'],
+      'security': s['security'],
+      'controlling_minor_faction_cased': s['controlling'],
+      'controlling_minor_faction': s['controlling'].lower(),
+      'factions': factions,
+      'conflicts': conflicts,
+      'updated_at': timestamp(s['updated_at']),
+    }
+
+  def populate(self, db: 'database.Database', batch: int = 5000) -> None:
+    """
+    Write the whole galaxy straight into the database, in bulk.
+
+    This bypasses the `EliteBGS` ingest path, so is only for getting a large
+    data set in place quickly.  The tables should be empty.
+
+    :param db: `ed_bgs.Database` instance.
+    :param batch: How many rows to insert per statement.
+    """
+    faction_ids = db.record_factions(self.faction_names)
+
+    systems = []
+    presences = []
+    states: Dict[str, List[dict]] = {kind: [] for kind in db.faction_state_tables}
+    conflicts = []
+    for name, s in self.systems.items():
+      systems.append(
+        {
+          'systemaddress': s['system_address'],
+          'name': name,
+          'starpos_x': s['x'],
+          'starpos_y': s['y'],
+          'starpos_z': s['z'],
+          'system_allegiance': s['allegiance'],
+          'system_economy': s['primary_economy'],
+          'system_secondary_economy': s['secondary_economy'],
+          'system_controlling_faction': faction_ids[s['controlling']],
+          'system_government': s['government'],
+          'system_security': s['security'],
+          'last_updated': naive_utc(s['updated_at']),
+        }
+      )
+
+      for f, p in s['presences'].items():
+        presences.append(
+          {
+            'faction_id': faction_ids[f],
+            'systemaddress': s['system_address'],
+            'state': p['state'],
+            'influence': p['influence'],
+            'happiness': p['happiness'],
+          }
+        )
+        for kind in states:
+          states[kind].extend(
+            {'faction_id': faction_ids[f], 'systemaddress': s['system_address'], 'state': state}
+            for state in p[kind]
+          )
+
+      for c in s['conflicts']:
+        # As per `Database.record_conflict()` the factions are in name order.
+        (f1, d1), (f2, d2) = sorted(zip(c['factions'], c['days_won']))
+        conflicts.append(
+          {
+            'systemaddress': s['system_address'],
+            'faction1_id': faction_ids[f1],
+            'faction2_id': faction_ids[f2],
+            'faction1_days_won': d1,
+            'faction2_days_won': d2,
+            'status': c['status'],
+            'conflict_type': c['type'],
+            'last_updated': naive_utc(s['updated_at']),
+          }
+        )
+
+    with db.engine.begin() as conn:
+      for table, rows in (
+        (db.systems, systems),
+        (db.factions_presences, presences),
+        *((db.faction_state_tables[kind], rows) for kind, rows in states.items()),
+      ):
+        for chunk in chunks(rows, batch):
+          conn.execute(table.insert(), chunk)
+
+      for chunk in chunks(conflicts, batch):
+        result = conn.execute(
+          insert(db.conflicts).values(chunk).returning(
+            db.conflicts.c.id, db.conflicts.c.faction1_id, db.conflicts.c.faction2_id
+          )
+        )
+        factions_conflicts = []
+        for r in result:
+          factions_conflicts.append({'faction_id': r.faction1_id, 'conflict_id': r.id})
+          factions_conflicts.append({'faction_id': r.faction2_id, 'conflict_id': r.id})
+
+        conn.execute(db.factions_conflicts.insert(), factions_conflicts)
+
+    db.record_ticks(self.ticks(self.now - datetime.timedelta(days=30)))
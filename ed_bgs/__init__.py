@@ -1,5 +1,8 @@
 """Top level Elite BGS module."""
 from ed_bgs.bgs import BGS  # noqa: F401
+from ed_bgs.client import HttpClient  # noqa: F401
+from ed_bgs.daemon import UpdateDaemon  # noqa: F401
 from ed_bgs.database import Database  # noqa: F401
 from ed_bgs.elitebgs_app import EliteBGS  # noqa: F401
+from ed_bgs.route import RouteSolver  # noqa: F401
 from ed_bgs.spansh import Spansh  # noqa: F401
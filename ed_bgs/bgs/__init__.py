@@ -1,2 +1,6 @@
 """BGS module."""
 from ed_bgs.bgs.bgs import BGS  # noqa: F401
+from ed_bgs.bgs.context import AnalysisContext  # noqa: F401
+from ed_bgs.bgs.projection import InfluenceProjection, LinearGrowth, WineGrowth  # noqa: F401
+from ed_bgs.bgs.scheduler import RefreshScheduler  # noqa: F401
+from ed_bgs.bgs.ticks import TickTimeline  # noqa: F401
@@ -4,12 +4,18 @@ Functionality related to operating on BGS data.
 Includes heuristics and the like.
 """
 from datetime import datetime, timedelta, timezone
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from ed_bgs.bgs.context import AnalysisContext
+from ed_bgs.bgs.projection import InfluenceProjection, LinearGrowth
+from ed_bgs.bgs.ticks import TickTimeline
 
 # isort off
 if TYPE_CHECKING:
   import logging
 
+  import sqlalchemy
+
   import ed_bgs.database as database
   import ed_bgs.elitebgs_app.elitebgs as elitebgs
 # isort on
@@ -18,34 +24,94 @@ if TYPE_CHECKING:
 class BGS:
   """Container class for BGS related functions."""
 
-  def __init__(self, logger: 'logging.Logger', db: 'database.Database', ebgs: 'elitebgs.EliteBGS'):
-    """Initilised the BGS class instance."""
+  def __init__(
+    self, logger: 'logging.Logger', db: 'database.Database', ebgs: 'elitebgs.EliteBGS',
+    projection: InfluenceProjection = None
+  ):
+    """
+    Initilised the BGS class instance.
+
+    :param logger: `logging.Logger` instance.
+    :param db: `ed_bgs.Database` instance.
+    :param ebgs: `ed_bgs.EliteBGS` instance.
+    :param projection: How to project influence growth, default linear.
+    """
     self.logger = logger
     self.db = db
     self.ebgs = ebgs
+    self.projection = projection if projection is not None else InfluenceProjection()
+    self.timeline: Optional[TickTimeline] = None
+
+  def tick_timeline(self, since: datetime) -> TickTimeline:
+    """
+    Get the timeline of ticks, reaching back to at least the given time.
+
+    The ticks are only refreshed from elitebgs.app if the timeline we already
+    have doesn't reach back far enough, or there could since have been a
+    newer tick.
+
+    :param since: `datetime.datetime` of the oldest time of interest.
+    :returns: `TickTimeline` of known ticks.
+    """
+    if self.timeline is None or not self.timeline.covers(since) or not self.timeline.is_current():
+      self.timeline = self.ebgs.tick_timeline(since)
+
+    return self.timeline
+
+  def analysis_context(
+    self, faction_ids: Iterable[int], since: datetime, tick_plus: Optional[float] = None
+  ) -> AnalysisContext:
+    """
+    Gather the data for the heuristics, for the given factions, in one go.
+
+    :param faction_ids: Our DB ids of the factions of interest.
+    :param since: `datetime.datetime` of newest data that's OK.
+    :param tick_plus: If `possible_losing_conflicts()` will be used, its
+      `tick_plus`, as it looks at data older than its own cut-off.
+    :returns: `AnalysisContext` to pass to the heuristics.
+    """
+    horizon = since
+    if tick_plus is not None:
+      horizon = max(horizon, self.tick_time_x_ago(6) + timedelta(hours=tick_plus))
+
+    return AnalysisContext(self.db, self, faction_ids, horizon)
 
-  def systems_outdated(self, faction_id: int, since: datetime) -> list:
+  def systems_outdated(self, faction_id: int, since: datetime, context: Optional[AnalysisContext] = None) -> list:
     """
     Determine all systems the given faction is known in, in need of update.
 
     :param faction_id: Our DB id of the faction of interest.
     :param since: `datetime.datetime` of newest data that's OK.
+    :param context: `AnalysisContext` to use, rather than querying.
     :returns: list of system names.
     """
-    systems = self.db.systems_older_than(since, faction_id=faction_id)
+    if context is not None:
+      return [s.name for s in context.stale_systems(faction_id, since)]
+
+    systems = self.db.iter_systems_older_than(since, faction_id=faction_id, columns=('name',))
     return [s.name for s in systems]
 
-  def active_conflicts_needing_update(self, faction_id: int, since: datetime) -> list:
+  def active_conflicts_needing_update(
+    self, faction_id: int, since: datetime, context: Optional[AnalysisContext] = None
+  ) -> list:
     """
     Determine systems in need of data update due to active conflict.
 
     :param faction_id: Our DB id of the faction of interest.
     :param since: `datetime.datetime` of newest data that's OK.
+    :param context: `AnalysisContext` to use, rather than querying.
     :returns: list of system names.
     """
     # Anywhere we know there was a conflict already and not updated since
     # the last known tick + fuzz.
-    systems = self.db.systems_conflicts_older_than(since, faction_id=faction_id)
+    systems: Iterable['sqlalchemy.engine.Row']
+    if context is not None:
+      # One per system, as with the query.
+      systems = list({c.name: c for c in context.stale_conflicts(faction_id, since)}.values())
+
+    else:
+      systems = self.db.iter_systems_conflicts_older_than(since, faction_id=faction_id)
+
     to_update = []
     for s in systems:
       self.logger.debug(f'Adding system because of on-going conflict: {s.name}')
@@ -53,13 +119,17 @@ class BGS:
 
     return to_update
 
-  def possible_losing_conflicts(self, since: datetime, tick_plus: float = 2.1, faction_id: int = None) -> list:
+  def possible_losing_conflicts(
+    self, since: datetime, tick_plus: float = 2.1, faction_id: int = None,
+    context: Optional[AnalysisContext] = None
+  ) -> list:
     """
     Determine systems that might now be in 0:3 losing state in need of new data.
 
     :param since: `datetime.datetime` time to compare against.
     :param tick_plus: How many hours to add to tick times to 'ensure' new data.
     :param faction_id: Optional faction to filter on.
+    :param context: `AnalysisContext` to use, rather than querying.
     :returns: list of system names.
     """
     # How many days could a system go until we could *just* pull back a
@@ -74,7 +144,12 @@ class BGS:
     #       5    pending      22:50        5
     #       6    <none/other> 22:45        6
     since = self.tick_time_x_ago(6)
-    systems = self.db.systems_older_than(since + timedelta(hours=tick_plus), faction_id=faction_id)
+    if context is not None:
+      systems = context.stale_systems(faction_id, since + timedelta(hours=tick_plus))
+
+    else:
+      systems = self.db.systems_older_than(since + timedelta(hours=tick_plus), faction_id=faction_id)
+
     to_update = []
     for s in systems:
       self.logger.debug(f'Adding system because faction could now be losing 0:3 in unknown conflict: {s.name}')
@@ -82,80 +157,157 @@ class BGS:
 
     return to_update
 
-  def stale_danger_of_conflicts(self, since: datetime, faction_id: int) -> list:  # noqa: CCR001
+  def stale_danger_of_conflicts(
+    self, since: datetime, faction_id: int, context: Optional[AnalysisContext] = None
+  ) -> list:
     """
     Determine systems with data stale enough to be in danger of a conflict.
 
+    With linear influence growth the comparisons are done in the database,
+    once for all of a `context`'s factions if given one.  Otherwise
+    `stale_danger_of_conflicts_projected()` is used.
+
     Assumptions:
 
       1. The target faction itself won't have changed in influence.
 
     :param faction_id: Our DB id of the faction of interest.
     :param since: `datetime.datetime` of newest data that's OK.
+    :param context: `AnalysisContext` to use, rather than querying.
     :returns: list of system names.
     """
-    # What we'll return
+    growth = self.projection.growth
+    if not isinstance(growth, LinearGrowth):
+      return self.stale_danger_of_conflicts_projected(since, faction_id, context=context)
+
+    if context is not None:
+      danger = context.danger(faction_id, since, growth.rate)
+
+    else:
+      # The systems are sorted in ascending (oldest first) last_updated order,
+      # thus the first one has the oldest data.  So use that to get ticks *once*.
+      systems = self.db.iter_systems_older_than(
+        since, faction_id=faction_id, columns=('last_updated',), yield_per=1
+      )
+      oldest = next(systems, None)
+      systems.close()
+      if oldest is None:
+        return []
+
+      oldest_update = oldest.last_updated.astimezone(tz=timezone.utc)
+      ticks = self.tick_timeline(oldest_update).ticks_after(oldest_update)
+      danger = self.db.systems_in_danger_of_conflict(since, faction_id, ticks, growth=growth.rate)
+
     to_update = []
+    for d in danger:
+      self.logger.debug(f"""
+System '{d.name}' ({d.systemaddress})
+Interest Faction: {faction_id}
+Rival    Faction: {d.faction_id} - gap {d.gap}
+""")
+      if d.name not in to_update:
+        to_update.append(d.name)
 
-    # Need to consider every system the given faction is in that doesn't have
-    # data since the given time (likely last tick plus 'fuzz').
-    systems = self.db.systems_older_than(since, faction_id=faction_id)
+    return to_update
 
-    # The systems are sorted in ascending (oldest first) last_updated order,
-    # thus the first one has the oldest data.  So use that to get ticks *once*
-    # for use in the loop below.
-    ticks = self.ebgs.ticks_since(systems[0].last_updated.astimezone(tz=timezone.utc))
+  def stale_danger_of_conflicts_projected(
+    self, since: datetime, faction_id: int, context: Optional[AnalysisContext] = None
+  ) -> list:
+    """
+    Determine systems with data stale enough to be in danger of a conflict.
 
-    # Now for each of those systems
-    for s in systems:
-      self.logger.debug(f'Considering system:\n{s.name}')
+    This is `stale_danger_of_conflicts()` done in Python, screening every
+    (system, faction) pair at once with `self.projection`.  So it works for
+    any growth model, and is the reference for what the database version
+    should find, see `benchmarks/equivalence.py`.
 
-      # How many ticks since this system was updated ?
-      ticks_since = self.ticks_since(ticks, s.last_updated.astimezone(tz=timezone.utc))
+    Assumptions:
 
-      # We need the inf% of all the factions in that system
-      factions = self.db.system_factions_data(s.systemaddress)
+      1. The target faction itself won't have changed in influence.
 
-      # Find the data for the target faction
-      f_faction = next(filter(lambda f: f.faction_id == faction_id, factions))
+    :param faction_id: Our DB id of the faction of interest.
+    :param since: `datetime.datetime` of newest data that's OK.
+    :param context: `AnalysisContext` to use, rather than querying.
+    :returns: list of system names.
+    """
+    # Need to consider every system the given faction is in that doesn't have
+    # data since the given time (likely last tick plus 'fuzz').
+    if context is not None:
+      systems = context.stale_systems(faction_id, since)
 
-      if f_faction.influence < 0.07:
-        # If interest-faction is below 7% ? it can't get into conflicts.
-        break
+    else:
+      systems = self.db.systems_older_than(since, faction_id=faction_id)
+
+    if not systems:
+      return []
 
-      # Now to check if the faction of interest could now be in a conflict.
-      for f in factions:
-        danger = False
+    if context is not None:
+      # Already has the presences, and ticks reaching back far enough.
+      systems_factions = context.presences
+      timeline = context.timeline
 
-        if f.faction_id == faction_id:
-          continue
+    else:
+      # We need the inf% of all the factions in those systems, fetched in one go
+      systems_factions = self.db.systems_factions_data(s.systemaddress for s in systems)
 
-        self.logger.debug(f'Considering faction:\n{f.faction_id}')
+      # The systems are sorted in ascending (oldest first) last_updated order,
+      # thus the first one has the oldest data.  So use that to get ticks *once*
+      # for use in the loop below.
+      timeline = self.tick_timeline(systems[0].last_updated.astimezone(tz=timezone.utc))
 
-        if f.influence < f_faction.influence:
-          # It's below 'us', so what *could* it be now ?
-          # Need to step day by day in case of an overshoot.
-          for t in range(1, ticks_since):
-            possible_inf = self.influence_could_be(f.influence, t)
-            if abs(f_faction.influence - possible_inf) < 0.05:
-              danger = True
-              break
+    pairs = self._rival_pairs(systems, faction_id, systems_factions, timeline)
+    pair_systems = [p[0] for p in pairs]
+    pair_factions = [p[1] for p in pairs]
+    targets = [p[2] for p in pairs]
+    influences = [p[1].influence for p in pairs]
+    pair_ticks = [p[3] for p in pairs]
 
-        else:
-          # It's above us, and we assume we don't grow.
-          if abs(f_faction.influence - f.influence) < 0.05:
-            danger = True
+    # Now to check if the faction of interest could now be in a conflict.
+    _, danger = self.projection.screen(targets, influences, pair_ticks)
 
-        if danger:
-          self.logger.debug(f"""
+    to_update = []
+    for s, f, target, d in zip(pair_systems, pair_factions, targets, danger):
+      if d and s.name not in to_update:
+        self.logger.debug(f"""
 System '{s.name}' ({s.systemaddress})
-Interest Faction: {f_faction.faction_id} - {f_faction.influence}
+Interest Faction: {faction_id} - {target}
 This     Faction: {f.faction_id} - {f.influence}
 """)
-          to_update.append(s)
-          break
+        to_update.append(s.name)
+
+    return to_update
+
+  def _rival_pairs(
+    self, systems: list, faction_id: int, systems_factions: Dict[int, list], timeline: TickTimeline
+  ) -> List[Tuple['sqlalchemy.engine.Row', 'sqlalchemy.engine.Row', float, int]]:
+    """
+    Gather up every other faction in each system, against the faction of interest.
+
+    :param systems: The stale systems rows.
+    :param faction_id: Our DB id of the faction of interest.
+    :param systems_factions: `dict` of systemaddress -> factions_presences rows.
+    :param timeline: `TickTimeline` reaching back to the oldest system.
+    :returns: `list` of (system, rival presence, interest faction influence,
+      ticks since the system was updated), for systems where the faction of
+      interest could get into a conflict.
+    """
+    pairs: List[Tuple['sqlalchemy.engine.Row', 'sqlalchemy.engine.Row', float, int]] = []
+    for s in systems:
+      factions = systems_factions[s.systemaddress]
+
+      # Find the data for the target faction
+      f_faction = next(filter(lambda f: f.faction_id == faction_id, factions))
 
-    return [s.name for s in to_update]
+      if f_faction.influence < 0.07:
+        # If interest-faction is below 7% ? it can't get into conflicts.
+        continue
+
+      # How many ticks since this system was updated ?
+      ticks_since = timeline.ticks_since(s.last_updated.astimezone(tz=timezone.utc))
+
+      pairs.extend((s, f, f_faction.influence, ticks_since) for f in factions if f.faction_id != faction_id)
+
+    return pairs
 
   def ticks_since(self, ticks: list, since: datetime) -> int:
     """
@@ -164,11 +316,7 @@ This     Faction: {f.faction_id} - {f.influence}
     :param ticks: The list of ticks from elitebgs.app API.
     :param since: `datetime.datetime` of start point.
     """
-    t = 0
-    while t < len(ticks) and ticks[t] > since:
-      t += 1
-
-    return t
+    return TickTimeline(ticks).ticks_since(since)
 
   def influence_could_be(self, influence: float, ticks: int) -> float:
     """
@@ -179,28 +327,25 @@ This     Faction: {f.faction_id} - {f.influence}
     :returns float: The projected max influence.
     """
     # This is a *very* rough guesstimate of how much the other faction's
-    # influence could have increased.  It could be more than 5% if
-    # they started very low, or much less if they started higher.
-    # Ref: <https://forums.frontier.co.uk/threads/influence-caps-gains-and-the-wine-analogy.423837/>
-    # Ref: <https://forums.frontier.co.uk/threads/influence-caps-gains-and-the-wine-analogy.423837/page-6#post-8319830>
-    for t in range(ticks):
-      influence += 0.05
-
-    return influence
+    # influence could have increased, per `self.projection`'s growth model.
+    return float(self.projection.project(influence, ticks))
 
   def tick_time_x_ago(self, ticks_ago: int) -> datetime:
     """
     Determine the time of the tick X ticks ago.
 
     :param ticks_ago: How many ticks to look back.
+    :raises ValueError: If we don't know of a tick that long ago.
     """
     # We want to go back to the tick *before*, so ticks_ago + 1
-    ticks = self.ebgs.ticks_since(
+    timeline = self.tick_timeline(
       datetime.now(tz=timezone.utc)
       - timedelta(days=ticks_ago + 1)
     )
 
     days_ago = datetime.now(tz=timezone.utc) - timedelta(days=ticks_ago)
-    tick_time = next(filter(lambda t: t < days_ago, ticks))
+    tick = timeline.tick_containing(days_ago)
+    if tick is None:
+      raise ValueError(f'No known tick at or before {days_ago}, {ticks_ago} ticks ago')
 
-    return tick_time
+    return tick
@@ -0,0 +1,142 @@
+"""
+Data for a run of the BGS heuristics, gathered once.
+
+Each heuristic used to query the stale systems, their presences and
+conflicts, and the ticks, for itself.  An `AnalysisContext` gathers each
+of those, for every faction of interest at once, in a single query.  The
+heuristics then just filter it, so adding another doesn't add more queries.
+
+Nothing is gathered until a heuristic first needs it, so a context costs
+nothing beyond what the selected heuristics use.
+"""
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from ed_bgs.bgs.ticks import TickTimeline
+
+# isort off
+if TYPE_CHECKING:
+  import sqlalchemy
+
+  import ed_bgs.database as database
+  from ed_bgs.bgs.bgs import BGS
+# isort on
+
+
+class AnalysisContext:
+  """Stale systems, with their presences and conflicts, plus the ticks."""
+
+  def __init__(self, db: 'database.Database', bgs: 'BGS', faction_ids: Iterable[int], horizon: datetime):
+    """
+    Initialise the context, for the given factions, older than `horizon`.
+
+    :param db: `ed_bgs.Database` instance.
+    :param bgs: `ed_bgs.BGS` instance, for the tick timeline.
+    :param faction_ids: Our DB ids of the factions of interest.
+    :param horizon: `datetime` of the newest data any heuristic will want.
+    """
+    self.db = db
+    self.bgs = bgs
+    self.faction_ids = list(faction_ids)
+    self.horizon = horizon
+
+    # Per growth rate, see `danger()`.
+    self._danger: Dict[float, list] = {}
+
+  @cached_property
+  def faction_systems(self) -> Dict[int, List['sqlalchemy.engine.Row']]:
+    """Each faction's systems, as rows of (faction_id, systemaddress, name, last_updated), oldest first."""
+    faction_systems: Dict[int, list] = {f: [] for f in self.faction_ids}
+    for s in self.db.iter_factions_systems_older_than(self.horizon, self.faction_ids):
+      faction_systems[s.faction_id].append(s)
+
+    return faction_systems
+
+  @cached_property
+  def systems(self) -> List['sqlalchemy.engine.Row']:
+    """The systems any of the factions is in, once each, oldest first."""
+    systems = {s.systemaddress: s for f in self.faction_systems.values() for s in f}
+
+    return sorted(systems.values(), key=lambda s: s.last_updated)
+
+  @cached_property
+  def presences(self) -> Dict[int, list]:
+    """`dict` of systemaddress -> `list` of factions_presences rows, in ascending influence order."""
+    return self.db.systems_factions_data(s.systemaddress for s in self.systems)
+
+  @cached_property
+  def conflicts(self) -> List['sqlalchemy.engine.Row']:
+    """The `conflicts` rows, plus system `name`, involving any of the factions."""
+    return self.db.conflicts_older_than(self.horizon, faction_ids=self.faction_ids)
+
+  @cached_property
+  def timeline(self) -> TickTimeline:
+    """`TickTimeline` reaching back to the oldest system."""
+    if not self.systems:
+      return self.bgs.tick_timeline(self.horizon)
+
+    return self.bgs.tick_timeline(self.systems[0].last_updated.astimezone(tz=timezone.utc))
+
+  def _check(self, since: datetime) -> None:
+    """Ensure a heuristic isn't asking for data newer than we have."""
+    if since > self.horizon:
+      raise ValueError(f'{since} is beyond the analysis context horizon of {self.horizon}')
+
+  def stale_systems(self, faction_id: Optional[int], since: datetime) -> list:
+    """
+    Return the systems with data older than `since`.
+
+    :param faction_id: Only those this faction is in, else all.
+    :param since: `datetime` of oldest data to not need updating.
+    :returns: Rows with systemaddress, name and last_updated, oldest first.
+    """
+    self._check(since)
+    systems = self.systems if faction_id is None else self.faction_systems[faction_id]
+
+    return [s for s in systems if s.last_updated.astimezone(tz=timezone.utc) < since]
+
+  def stale_conflicts(self, faction_id: int, since: datetime) -> list:
+    """
+    Return the conflicts, not yet over, with data older than `since`.
+
+    :param faction_id: Only those this faction is involved in.
+    :param since: `datetime` of oldest data to not need updating.
+    :returns: conflicts rows, plus system `name`.
+    """
+    self._check(since)
+
+    return [
+      c for c in self.conflicts
+      if faction_id in (c.faction1_id, c.faction2_id) and c.last_updated.astimezone(tz=timezone.utc) < since
+    ]
+
+  def danger(self, faction_id: int, since: datetime, growth: float) -> list:
+    """
+    Return the (system, rival) pairs in danger of a conflict, with data older than `since`.
+
+    The database finds these for all the factions in one query, see
+    `Database.systems_in_danger_of_conflict()`.  Whether a system is in
+    danger only depends on its data's age, so the result for any `since`
+    is just a subset of that at the horizon.
+
+    :param faction_id: Only those for this faction.
+    :param since: `datetime` of oldest data to not need updating.
+    :param growth: Maximum influence growth per tick.
+    :returns: Rows of `Database.systems_in_danger_of_conflict()`.
+    """
+    self._check(since)
+    if growth not in self._danger:
+      if self.systems:
+        ticks = self.timeline.ticks_after(self.systems[0].last_updated.astimezone(tz=timezone.utc))
+        self._danger[growth] = self.db.systems_in_danger_of_conflict(
+          self.horizon, None, ticks, growth=growth, faction_ids=self.faction_ids
+        )
+
+      else:
+        self._danger[growth] = []
+
+    return [
+      d for d in self._danger[growth]
+      if d.interest_faction_id == faction_id and d.last_updated.astimezone(tz=timezone.utc) < since
+    ]
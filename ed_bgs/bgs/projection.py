@@ -0,0 +1,135 @@
+"""
+Batched projection of faction influence over ticks.
+
+Rather than stepping one faction at a time through the ticks, every
+candidate faction is projected at once as NumPy arrays, with a pluggable
+model of how much influence a faction could gain in a tick.
+
+Ref: <https://forums.frontier.co.uk/threads/influence-caps-gains-and-the-wine-analogy.423837/>
+Ref: <https://forums.frontier.co.uk/threads/influence-caps-gains-and-the-wine-analogy.423837/page-6#post-8319830>
+"""
+from typing import Callable, Iterator, Tuple
+
+import numpy
+
+# A growth model takes an array of current influences and returns the
+# maximum influence each could gain in one tick.
+GrowthModel = Callable[[numpy.ndarray], numpy.ndarray]
+
+
+class LinearGrowth:
+  """The same maximum gain per tick, whatever the starting influence."""
+
+  def __init__(self, rate: float = 0.05):
+    """
+    Initialise the growth model.
+
+    :param rate: Maximum influence gain per tick.
+    """
+    self.rate = rate
+
+  def __call__(self, influence: numpy.ndarray) -> numpy.ndarray:
+    """Return the maximum gain for each influence."""
+    return numpy.full_like(influence, self.rate)
+
+
+class WineGrowth:
+  """
+  Maximum gain per tick that shrinks as influence grows.
+
+  Per the 'wine analogy' a faction with little of the system's influence
+  can gain more than 5% in a tick, whereas one already holding a lot gains
+  much less.  This is a rough fit to that, not a model of the actual BGS.
+  """
+
+  def __init__(self, max_rate: float = 0.10):
+    """
+    Initialise the growth model.
+
+    :param max_rate: Maximum influence gain per tick from zero influence.
+    """
+    self.max_rate = max_rate
+
+  def __call__(self, influence: numpy.ndarray) -> numpy.ndarray:
+    """Return the maximum gain for each influence."""
+    return self.max_rate * (1.0 - numpy.clip(influence, 0.0, 1.0)) ** 2
+
+
+class InfluenceProjection:
+  """Project influences forward over ticks, for many factions at once."""
+
+  def __init__(self, growth: GrowthModel = None):
+    """
+    Initialise the projection.
+
+    :param growth: The growth model to use, default `LinearGrowth()`.
+    """
+    self.growth = growth if growth is not None else LinearGrowth()
+
+  def _steps(self, influence: numpy.ndarray, ticks: numpy.ndarray) -> Iterator[Tuple[int, numpy.ndarray]]:
+    """
+    Step all the influences forward a tick at a time.
+
+    Each influence stops growing once its own number of ticks is reached.
+
+    :param influence: Starting influences.
+    :param ticks: How many ticks to project each influence.
+    :returns: (tick, projected influences) after each tick.
+    """
+    projected = influence
+    for t in range(1, int(ticks.max(initial=0)) + 1):
+      projected = numpy.where(t <= ticks, projected + self.growth(projected), projected)
+      yield t, projected
+
+  def project(self, influence: 'numpy.typing.ArrayLike', ticks: 'numpy.typing.ArrayLike') -> numpy.ndarray:
+    """
+    Estimate the highest influences that could result from `ticks` ticks.
+
+    :param influence: The starting influences.
+    :param ticks: How many ticks to progress each.
+    :returns: The projected max influences.
+    """
+    influence, ticks = numpy.broadcast_arrays(
+      numpy.asarray(influence, dtype=float),
+      numpy.asarray(ticks, dtype=int),
+    )
+
+    projected = influence
+    for _, projected in self._steps(influence, ticks):
+      pass
+
+    return projected
+
+  def screen(
+    self, target: 'numpy.typing.ArrayLike', influence: 'numpy.typing.ArrayLike',
+    ticks: 'numpy.typing.ArrayLike', gap: float = 0.05
+  ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Determine which factions could now be within `gap` of a target influence.
+
+    The target faction is assumed to not have changed.  A faction already
+    at or above the target is a danger if within `gap` of it.  One below is
+    a danger if, at any tick from 1 up to, but not including, its `ticks`,
+    its projected influence is within `gap`.  Stepping tick by tick catches
+    it overshooting the target.
+
+    :param target: The influences of the faction of interest.
+    :param influence: The starting influences of the other factions.
+    :param ticks: How many ticks since each influence was known.
+    :param gap: Influence difference that is considered dangerous.
+    :returns: (projected max influences after `ticks`, `bool` danger flags)
+    """
+    target, influence, ticks = numpy.broadcast_arrays(
+      numpy.asarray(target, dtype=float),
+      numpy.asarray(influence, dtype=float),
+      numpy.asarray(ticks, dtype=int),
+    )
+
+    below = influence < target
+    danger = ~below & (numpy.abs(target - influence) < gap)
+
+    projected = influence
+    for t, projected in self._steps(influence, ticks):
+      danger |= below & (t < ticks) & (numpy.abs(target - projected) < gap)
+
+    return projected, danger
@@ -0,0 +1,190 @@
+"""
+Rank systems by how urgently they need fresh data.
+
+With only so many API requests to spend, refreshing every system alike
+wastes most of them.  Instead each system a tracked faction is present in
+is scored on the factors that matter for decisions:
+
+  * conflict - an active conflict, the more so the nearer it is to being
+    decided, and most of all if we're behind.
+  * gap - how close a rival's influence is, i.e. the risk of a conflict.
+  * retreat - how close our influence is to the retreat threshold.
+  * ticks - how many ticks since our data, i.e. how much could have changed.
+
+Data newer than the latest tick scores nothing, as the BGS won't have
+moved since.
+"""
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+
+  import ed_bgs.database as database
+  from ed_bgs.bgs.bgs import BGS
+# isort on
+
+
+class RefreshScheduler:
+  """Choose which systems to spend API requests on."""
+
+  DEFAULT_WEIGHTS = {
+    'conflict': 4.0,
+    'gap': 2.0,
+    'retreat': 2.0,
+    'ticks': 1.0,
+  }
+  # First to this many days won, wins.
+  CONFLICT_DAYS = 4
+  # Below this influence a faction is at risk of retreating.
+  RETREAT_INFLUENCE = 0.025
+
+  def __init__(
+    self, logger: 'logging.Logger', db: 'database.Database', bgs: 'BGS',
+    weights: Optional[Dict[str, float]] = None, gap: float = 0.10, retreat: float = 0.07, max_ticks: int = 5
+  ):
+    """
+    Initialise the scheduler.
+
+    :param logger: `logging.Logger` instance.
+    :param db: `ed_bgs.Database` instance.
+    :param bgs: `ed_bgs.BGS` instance, for the tick timeline.
+    :param weights: Overrides of `DEFAULT_WEIGHTS`, per factor.
+    :param gap: Influence gap to a rival below which there's any urgency.
+    :param retreat: Influence below which there's any retreat urgency.
+    :param max_ticks: Ticks since update at which that factor is maxed.
+    """
+    self.logger = logger
+    self.db = db
+    self.bgs = bgs
+    self.weights = {**self.DEFAULT_WEIGHTS, **(weights or {})}
+    self.gap = gap
+    self.retreat = retreat
+    self.max_ticks = max_ticks
+
+  def conflict_urgency(self, conflicts: list, faction_ids: Iterable[int]) -> float:
+    """
+    Score the conflicts in a system, 0 to 1.
+
+    :param conflicts: The system's `conflicts` rows.
+    :param faction_ids: The tracked factions.
+    :returns: Urgency of the most urgent conflict involving a tracked faction.
+    """
+    urgency = 0.0
+    for c in conflicts:
+      if c.faction1_id in faction_ids:
+        ours, theirs = c.faction1_days_won, c.faction2_days_won
+
+      elif c.faction2_id in faction_ids:
+        ours, theirs = c.faction2_days_won, c.faction1_days_won
+
+      else:
+        continue
+
+      if c.status == 'pending':
+        urgency = max(urgency, 0.4)
+
+      elif theirs > ours:
+        urgency = 1.0
+
+      else:
+        urgency = max(urgency, min(1.0, 0.5 + 0.5 * max(ours, theirs) / (self.CONFLICT_DAYS - 1)))
+
+    return urgency
+
+  def influence_urgency(self, presences: list, faction_ids: Iterable[int]) -> Dict[str, float]:
+    """
+    Score how close tracked factions are to a rival, and to retreat, 0 to 1.
+
+    :param presences: The system's `factions_presences` rows.
+    :param faction_ids: The tracked factions.
+    :returns: `dict` with 'gap' and 'retreat' urgencies.
+    """
+    urgency = {'gap': 0.0, 'retreat': 0.0}
+    rivals = [p.influence for p in presences if p.faction_id not in faction_ids]
+    for p in presences:
+      if p.faction_id not in faction_ids:
+        continue
+
+      if rivals:
+        gap = min(abs(p.influence - r) for r in rivals)
+        urgency['gap'] = max(urgency['gap'], 1.0 - min(1.0, gap / self.gap))
+
+      if p.influence < self.retreat:
+        urgency['retreat'] = max(
+          urgency['retreat'],
+          1.0 - max(0.0, p.influence - self.RETREAT_INFLUENCE) / (self.retreat - self.RETREAT_INFLUENCE)
+        )
+
+    return urgency
+
+  def rank(self, faction_ids: Iterable[int], now: Optional[datetime] = None) -> List[dict]:
+    """
+    Score every system any of the given factions is in, most urgent first.
+
+    :param faction_ids: Our DB ids of the factions to track.
+    :param now: Time to consider data stale before, default now.
+    :returns: `list` of `dict` with 'name', 'systemaddress', 'score' and the
+      per-factor 'urgency', only for systems with a score.
+    """
+    faction_ids = set(faction_ids)
+    if now is None:
+      now = datetime.now(tz=timezone.utc)
+
+    systems = {
+      s.systemaddress: s for s in self.db.iter_systems_older_than(
+        now, faction_ids=faction_ids, columns=('systemaddress', 'name', 'last_updated')
+      )
+    }
+
+    if not systems:
+      return []
+
+    oldest = min(s.last_updated for s in systems.values()).astimezone(tz=timezone.utc)
+    timeline = self.bgs.tick_timeline(oldest)
+    presences = self.db.systems_factions_data(systems)
+    conflicts = self.db.systems_conflicts(systems)
+
+    ranked = []
+    for addr, s in systems.items():
+      ticks = timeline.ticks_since(s.last_updated.astimezone(tz=timezone.utc))
+      if ticks == 0:
+        continue
+
+      urgency = {
+        'conflict': self.conflict_urgency(conflicts[addr], faction_ids),
+        **self.influence_urgency(presences[addr], faction_ids),
+        'ticks': min(1.0, ticks / self.max_ticks),
+      }
+      ranked.append(
+        {
+          'name': s.name,
+          'systemaddress': addr,
+          'score': sum(self.weights[k] * u for k, u in urgency.items()),
+          'urgency': urgency,
+        }
+      )
+
+    ranked.sort(key=lambda r: r['score'], reverse=True)
+
+    return ranked
+
+  def top(self, faction_ids: Iterable[int], budget: int, now: Optional[datetime] = None) -> List[str]:
+    """
+    Choose the systems to refresh within a budget of API requests.
+
+    :param faction_ids: Our DB ids of the factions to track.
+    :param budget: How many systems can be fetched.
+    :param now: Time to consider data stale before, default now.
+    :returns: Names of the most urgent systems, at most `budget` of them.
+    """
+    chosen = self.rank(faction_ids, now=now)[:max(0, budget)]
+    for r in chosen:
+      self.logger.debug(
+        f"{r['name']}: {r['score']:.2f} ("
+        + ', '.join(f'{k} {u:.2f}' for k, u in r['urgency'].items())
+        + ')'
+      )
+
+    return [r['name'] for r in chosen]
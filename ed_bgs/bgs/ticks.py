@@ -0,0 +1,121 @@
+"""
+A timeline of BGS ticks.
+
+Answers tick questions with binary searches over a sorted list, rather than
+asking the elitebgs.app API again each time.
+"""
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+
+def _utc(when: datetime) -> datetime:
+  """
+  Ensure a `datetime` is timezone aware, in UTC.
+
+  As elsewhere, naive times are taken as local time, which our scripts set to
+  be UTC.
+  """
+  return when.astimezone(tz=timezone.utc)
+
+
+class TickTimeline:
+  """Sorted, in-memory, timeline of ticks."""
+
+  def __init__(self, ticks: Iterable[datetime] = ()):
+    """
+    Initialise the timeline.
+
+    :param ticks: `datetime` of ticks, in any order.
+    """
+    self.ticks: List[datetime] = sorted({_utc(t) for t in ticks})
+
+  def __len__(self) -> int:
+    """Return how many ticks are in the timeline."""
+    return len(self.ticks)
+
+  @property
+  def earliest(self) -> Optional[datetime]:
+    """The earliest tick we know of, if any."""
+    return self.ticks[0] if self.ticks else None
+
+  @property
+  def latest(self) -> Optional[datetime]:
+    """The latest tick we know of, if any."""
+    return self.ticks[-1] if self.ticks else None
+
+  def add(self, ticks: Iterable[datetime]) -> None:
+    """
+    Add more ticks to the timeline.
+
+    :param ticks: `datetime` of ticks, in any order.
+    """
+    for t in ticks:
+      t = _utc(t)
+      i = bisect.bisect_left(self.ticks, t)
+      if i == len(self.ticks) or self.ticks[i] != t:
+        self.ticks.insert(i, t)
+
+  def covers(self, since: datetime) -> bool:
+    """
+    Determine if the timeline reaches back to the given time.
+
+    Ticks are daily, so that's if the earliest is no more than a day after.
+
+    :param since: `datetime` of interest.
+    """
+    return self.earliest is not None and (self.earliest - _utc(since)).days < 1
+
+  def is_current(self, now: Optional[datetime] = None) -> bool:
+    """
+    Determine if there can't yet have been a tick newer than those we know.
+
+    Ticks are daily, so that's if the latest is less than a day old.
+
+    :param now: `datetime` to check as of, default now.
+    """
+    if now is None:
+      now = datetime.now(tz=timezone.utc)
+
+    return self.latest is not None and _utc(now) - self.latest < timedelta(days=1)
+
+  def ticks_after(self, since: datetime) -> List[datetime]:
+    """
+    Return the ticks there have been since the given timestamp.
+
+    :param since: `datetime.datetime` of start point.
+    :returns: `list` of tick `datetime`, oldest first.
+    """
+    return self.ticks[bisect.bisect_right(self.ticks, _utc(since)):]
+
+  def ticks_since(self, since: datetime) -> int:
+    """
+    Determine how many ticks there have been since the given timestamp.
+
+    :param since: `datetime.datetime` of start point.
+    """
+    return len(self.ticks) - bisect.bisect_right(self.ticks, _utc(since))
+
+  def tick_x_ago(self, ticks_ago: int) -> Optional[datetime]:
+    """
+    Return the tick X ticks before the latest one.
+
+    :param ticks_ago: How many ticks to look back, 0 being the latest.
+    """
+    if ticks_ago < 0 or ticks_ago >= len(self.ticks):
+      return None
+
+    return self.ticks[-1 - ticks_ago]
+
+  def tick_containing(self, when: datetime) -> Optional[datetime]:
+    """
+    Return the tick that started the BGS 'day' containing the given time.
+
+    :param when: `datetime` of interest.
+    :returns: The latest tick at or before `when`, if known.
+    """
+    i = bisect.bisect_right(self.ticks, _utc(when))
+    if i == 0:
+      return None
+
+    return self.ticks[i - 1]
@@ -0,0 +1,2 @@
+"""Shared HTTP client for outbound API calls."""
+from ed_bgs.client.client import HttpClient, TokenBucket  # noqa: F401
@@ -0,0 +1,252 @@
+"""
+HTTP client with rate limiting, concurrency caps and retries.
+
+Every host gets its own token bucket and cap on in-flight requests.  The
+bucket's rate adapts: it's halved whenever the host throttles us, errors or
+times out, and creeps back up, by `increase` per successful request, to the
+configured maximum.  Throttled and failed requests of idempotent methods are
+retried with jittered exponential backoff, honouring any `Retry-After` the
+host gives.
+"""
+import datetime
+import email.utils
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+# isort on
+
+
+class TokenBucket:
+  """Thread-safe token bucket, with an adjustable rate."""
+
+  def __init__(self, rate: float, burst: float, min_rate: float = 0.1, increase: float = 0.05):
+    """
+    Initialise the bucket, full.
+
+    :param rate: Maximum, and initial, tokens per second.
+    :param burst: Maximum tokens that can accumulate.
+    :param min_rate: The rate will never be reduced below this.
+    :param increase: How much to raise the rate by per success.
+    """
+    self.max_rate = rate
+    self.rate = rate
+    self.burst = burst
+    self.min_rate = min(min_rate, rate)
+    self.increase = increase
+
+    self.tokens = burst
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def _refill(self) -> None:
+    """Add the tokens accumulated since last time.  Lock must be held."""
+    now = time.monotonic()
+    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def acquire(self) -> None:
+    """Take a token, waiting until one is available."""
+    while True:
+      with self.lock:
+        self._refill()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+
+        wait = (1 - self.tokens) / self.rate
+
+      time.sleep(wait)
+
+  def succeeded(self) -> None:
+    """Note a successful request, additively increasing the rate."""
+    with self.lock:
+      self._refill()
+      self.rate = min(self.max_rate, self.rate + self.increase)
+
+  def throttled(self) -> None:
+    """Note a throttled or failed request, halving the rate."""
+    with self.lock:
+      self._refill()
+      self.rate = max(self.min_rate, self.rate / 2)
+
+
+class HttpClient:
+  """`requests.Session` wrapper with per-host rate limits and retries."""
+
+  # Statuses that mean 'try again later'
+  RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+  # Methods that are safe to repeat, should a failed request have had effect
+  IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+  def __init__(
+    self, logger: 'logging.Logger', rate: float = 5.0, burst: float = 5.0, max_per_host: int = 4,
+    max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0, timeout: float = 30.0
+  ):
+    """
+    Initialise the client.
+
+    :param logger: `logging.Logger` instance.
+    :param rate: Maximum requests per second, per host.
+    :param burst: Maximum burst of requests, per host.
+    :param max_per_host: Maximum concurrent requests, per host.
+    :param max_retries: How many times to retry a failed request.
+    :param backoff: Base delay, in seconds, for exponential backoff.
+    :param max_backoff: Maximum delay, in seconds, between retries.
+    :param timeout: Request timeout, in seconds.
+    """
+    self.logger = logger
+    self.rate = rate
+    self.burst = burst
+    self.max_per_host = max_per_host
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.timeout = timeout
+
+    self.session = requests.Session()
+    # Enough pooled connections for all the concurrent requests.
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, max_per_host))
+    self.session.mount('https://', adapter)
+    self.session.mount('http://', adapter)
+
+    self.buckets: Dict[str, TokenBucket] = {}
+    self.semaphores: Dict[str, threading.BoundedSemaphore] = {}
+    self.lock = threading.Lock()
+
+  @classmethod
+  def from_config(cls, logger: 'logging.Logger', http_config: Optional[dict]) -> 'HttpClient':
+    """
+    Set up a client as per the `http:` configuration, if any.
+
+    :param logger: `logging.Logger` instance.
+    :param http_config: The `http` config `dict`.
+    :returns: The client.
+    """
+    http_config = http_config or {}
+    return cls(
+      logger,
+      rate=http_config.get('rate', 5.0),
+      burst=http_config.get('burst', 5.0),
+      max_per_host=http_config.get('max_per_host', 4),
+      max_retries=http_config.get('max_retries', 5),
+      timeout=http_config.get('timeout', 30.0),
+    )
+
+  def _host(self, url: str) -> str:
+    """Ensure the per-host limits for a URL's host exist, and return it."""
+    host = urlsplit(url).netloc
+    with self.lock:
+      if host not in self.buckets:
+        self.buckets[host] = TokenBucket(self.rate, self.burst)
+        self.semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+
+    return host
+
+  def _retry_after(self, r: requests.Response) -> Optional[float]:
+    """
+    Determine how long a response asked us to wait, if at all.
+
+    :param r: The response.
+    :returns: Seconds to wait, if a valid `Retry-After` was given.
+    """
+    retry_after = r.headers.get('Retry-After')
+    if retry_after is None:
+      return None
+
+    try:
+      return max(0.0, float(retry_after))
+
+    except ValueError:
+      pass
+
+    try:
+      when = email.utils.parsedate_to_datetime(retry_after)
+
+    except (TypeError, ValueError):
+      return None
+
+    return max(0.0, (when - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds())
+
+  def request(  # noqa: CCR001
+    self, method: str, url: str, retry: Optional[bool] = None, **kwargs: Any
+  ) -> requests.Response:
+    """
+    Make a request, within the host's limits, retrying as necessary.
+
+    :param method: HTTP method.
+    :param url: The URL.
+    :param retry: Whether to retry failures, default only for idempotent
+      methods, as e.g. a POST that got a 502 might still have been acted on.
+    :param kwargs: Passed on to `requests.Session.request()`.
+    :returns: The final response, which might still be an error status.
+    :raises requests.exceptions.RequestException: If the request never
+      got a response.
+    """
+    host = self._host(url)
+    bucket = self.buckets[host]
+    kwargs.setdefault('timeout', self.timeout)
+    if retry is None:
+      retry = method.upper() in self.IDEMPOTENT_METHODS
+
+    attempt = 0
+    while True:
+      bucket.acquire()
+      error: Optional[requests.exceptions.RequestException] = None
+      r: Optional[requests.Response] = None
+      with self.semaphores[host]:
+        try:
+          r = self.session.request(method, url, **kwargs)
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+          error = e
+
+      if r is not None and r.status_code not in self.RETRY_STATUSES:
+        bucket.succeeded()
+        return r
+
+      bucket.throttled()
+      if not retry or attempt >= self.max_retries:
+        if r is not None:
+          return r
+
+        raise error  # type: ignore
+
+      # Full jitter, unless the host told us how long to wait.
+      delay = self._retry_after(r) if r is not None else None
+      if delay is None:
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+
+      delay = min(delay, self.max_backoff)
+      self.logger.info(
+        f'{method} {url} failed ({r.status_code if r is not None else repr(error)}),'
+        f' retrying in {delay:.1f}s (now {bucket.rate:.2f} req/s to {host})'
+      )
+      time.sleep(delay)
+      attempt += 1
+
+  def get(self, url: str, **kwargs: Any) -> requests.Response:
+    """
+    Make a GET request, see `request()`.
+
+    :param url: The URL.
+    :param kwargs: Passed on to `requests.Session.request()`.
+    """
+    return self.request('GET', url, **kwargs)
+
+  def post(self, url: str, data: object = None, **kwargs: Any) -> requests.Response:
+    """
+    Make a POST request, see `request()`.  It's not retried, unless `retry=True`.
+
+    :param url: The URL.
+    :param data: Body data.
+    :param kwargs: Passed on to `requests.Session.request()`.
+    """
+    return self.request('POST', url, data=data, **kwargs)
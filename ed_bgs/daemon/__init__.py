@@ -0,0 +1,2 @@
+"""Long-running, tick-aware, data updates."""
+from ed_bgs.daemon.daemon import UpdateDaemon  # noqa: F401
@@ -0,0 +1,142 @@
+"""
+Keep the local data up to date, around the BGS tick.
+
+Rather than a cold start per run from cron, the daemon keeps its database
+engine, HTTP connection pool and response cache warm between updates.  It
+cheaply polls for a new tick, and when one is seen schedules a series of
+refresh 'waves' spread over the following hours.  elitebgs.app only gets
+new system data as players visit and report it, so each wave incrementally
+fetches just the systems that it has fresher data for than we do.
+"""
+import datetime
+import threading
+from typing import TYPE_CHECKING, List, Optional
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+
+  import ed_bgs.database as database
+  import ed_bgs.elitebgs_app as elitebgs_app
+# isort on
+
+
+class UpdateDaemon:
+  """Tick-aware update loop."""
+
+  def __init__(
+    self, logger: 'logging.Logger', db: 'database.Database', ebgs: 'elitebgs_app.EliteBGS', factions: List[str],
+    poll_interval: datetime.timedelta = datetime.timedelta(minutes=5),
+    spread: datetime.timedelta = datetime.timedelta(hours=6), waves: int = 6
+  ):
+    """
+    Initialise the daemon.
+
+    :param logger: `logging.Logger` instance.
+    :param db: `ed_bgs.Database` instance.
+    :param ebgs: `ed_bgs.EliteBGS` instance.
+    :param factions: Names of the factions to keep up to date.
+    :param poll_interval: How often to check for a new tick.
+    :param spread: How long after a tick to keep refreshing.
+    :param waves: How many refresh waves to spread over that time.
+    """
+    self.logger = logger
+    self.db = db
+    self.ebgs = ebgs
+    self.factions = factions
+    self.poll_interval = poll_interval
+    self.spread = spread
+    self.waves = max(1, waves)
+
+    self.last_tick: Optional[datetime.datetime] = None
+    self.next_poll: Optional[datetime.datetime] = None
+    # Times of the waves still to run, soonest first.
+    self.schedule: List[datetime.datetime] = []
+    self.stopping = threading.Event()
+
+  def stop(self) -> None:
+    """Ask the daemon to stop, e.g. from a signal handler."""
+    self.stopping.set()
+
+  def schedule_waves(self, tick: datetime.datetime, now: datetime.datetime) -> None:
+    """
+    Schedule the refresh waves following a tick.
+
+    The first is straight away, the rest evenly spread over `spread` after
+    the tick.  Any still pending from a previous tick are superseded.
+
+    :param tick: Time of the tick.
+    :param now: The current time.
+    """
+    step = self.spread / self.waves
+    self.schedule = [now] + [w for w in (tick + step * i for i in range(1, self.waves + 1)) if w > now]
+    self.logger.info(f'New tick {tick}, {len(self.schedule)} refresh waves until {self.schedule[-1]}')
+
+  def poll(self, now: datetime.datetime) -> None:
+    """
+    Check for a new tick, scheduling waves if there is one.
+
+    :param now: The current time.
+    """
+    self.next_poll = now + self.poll_interval
+    tick = self.ebgs.tick_timeline(now - datetime.timedelta(days=1)).latest
+    if tick is None:
+      self.logger.warning('No tick known, will try again next poll')
+      return
+
+    if self.last_tick is None or tick > self.last_tick:
+      self.last_tick = tick
+      self.schedule_waves(tick, now)
+
+  def wave(self) -> None:
+    """Incrementally refresh all the factions' systems with newer data."""
+    self.logger.info('Starting refresh wave')
+    self.ebgs.start_run()
+    for f in self.factions:
+      if self.stopping.is_set():
+        return
+
+      self.logger.info(f'Checking faction: {f} ...')
+      self.ebgs.faction(f, incremental=True)
+
+    self.logger.info(f'Saved {self.ebgs.fetches_saved} system fetches already made for other factions.')
+
+    ec = self.db.expire_conflicts()
+    self.logger.info(f'Expired {ec} conflicts. Refresh wave done.')
+
+  def step(self, now: datetime.datetime) -> datetime.datetime:
+    """
+    Do whatever is due now.
+
+    :param now: The current time.
+    :returns: When next to do something.
+    """
+    if self.next_poll is None or now >= self.next_poll:
+      self.poll(now)
+
+    if self.schedule and now >= self.schedule[0]:
+      # Waves missed while a long one ran are merged into this one.
+      self.schedule = [w for w in self.schedule if w > now]
+      self.wave()
+
+    if self.schedule:
+      return min(self.next_poll, self.schedule[0])  # type: ignore
+
+    return self.next_poll  # type: ignore
+
+  def run(self) -> None:
+    """Run until `stop()` is called."""
+    self.logger.info(f'Update daemon started for {len(self.factions)} factions')
+    while not self.stopping.is_set():
+      try:
+        wake = self.step(datetime.datetime.now(tz=datetime.timezone.utc))
+
+      except Exception:
+        # Whatever went wrong, a later poll or wave might well work.
+        self.logger.exception('Error during update, continuing')
+        wake = datetime.datetime.now(tz=datetime.timezone.utc) + self.poll_interval
+
+      delay = (wake - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds()
+      self.stopping.wait(max(1.0, delay))
+
+    self.logger.info('Update daemon stopped')
@@ -1,27 +1,53 @@
 """Database handling functionality."""
+import contextlib
 import datetime
+import os
 #  from sqlalchemy.sql.sqltypes import TIMESTAMP
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Dict, Generator, Iterable, Iterator, Optional
 
 import sqlalchemy
 # from sqlalchemy.orm import Session
 # SQLAlchemy Column types
 from sqlalchemy import (BigInteger, Column, DateTime, FetchedValue, Float, ForeignKey, Integer, MetaData, Sequence,
-                        Table, Text, UniqueConstraint, create_engine, delete, func, or_)
-from sqlalchemy.dialects.postgresql import insert
+                        Table, Text, UniqueConstraint, and_, bindparam, create_engine, delete, exists, func, or_,
+                        select, tuple_)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 
 # isort off
 if TYPE_CHECKING:
   import logging
 
 
+class SchemaVersionError(Exception):
+  """The database schema isn't at the alembic revision this code expects."""
+
+
 #########################################################################
 # Our base class for database operations
 ###########################################################################
 class Database(object):
   """Class for all database access."""
 
-  def __init__(self, url: str, logger: 'logging.Logger'):
+  # factions_presences columns holding per-tick data, i.e. those that need
+  # comparing to know if a presence has changed.
+  PRESENCE_DATA_COLUMNS = ('state', 'influence', 'happiness')
+
+  # Where the alembic migrations live, for checking the schema revision.
+  ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'alembic')
+
+  def __init__(self, url: str, logger: 'logging.Logger', schema: str = 'create'):
+    """
+    Initialise database access.
+
+    :param url: SQLAlchemy database URL.
+    :param logger: `logging.Logger` instance.
+    :param schema: How to ensure the schema is in place:
+
+      - 'create': `metadata.create_all()`, creating any missing tables.
+      - 'alembic': Only check the database is at the latest alembic
+        revision, raising `SchemaVersionError` if not.
+      - 'none': Assume the schema is correct.
+    """
     self.logger = logger
 
     self.engine = create_engine(url)
@@ -197,60 +223,204 @@ class Database(object):
         name='factions_conflicts_constraint',
       ),
     )
+
+    # BGS ticks, as declared by elitebgs.app
+    self.ticks = Table(
+      'ticks', self.metadata,
+      Column('time', DateTime, primary_key=True),
+    )
     ######################################################################
 
-    self.metadata.create_all(self.engine)
+    # The faction state tables, by kind of state.
+    self.faction_state_tables = {
+      'active': self.factions_active_states,
+      'pending': self.factions_pending_states,
+      'recovering': self.factions_recovering_states,
+    }
+
+    if schema == 'create':
+      self.metadata.create_all(self.engine)
+
+    elif schema == 'alembic':
+      self.check_schema_revision()
 
-  def record_faction(self, faction_name: str) -> Optional[int]:
+    elif schema != 'none':
+      raise ValueError(f'Unknown schema mode: {schema!r}')
+
+    # Registry of faction name -> id.  Faction ids never change once
+    # assigned, so we load them all once and then only ever need to go to
+    # the database for names we've not seen before.
+    self.faction_ids: Dict[str, int] = {}
+    self.load_factions()
+
+  def check_schema_revision(self) -> None:
+    """Ensure the database is at the head alembic revision."""
+    # Only needed for this, so not imported at the top.
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    heads = set(ScriptDirectory(self.ALEMBIC_DIR).get_heads())
+    with self.engine.connect() as conn:
+      current = set(MigrationContext.configure(conn).get_current_heads())
+
+    if current != heads:
+      raise SchemaVersionError(
+        f'Database is at alembic revision(s) {sorted(current)}, expected {sorted(heads)}.'
+        ' Run `alembic upgrade head`.'
+      )
+
+    self.logger.debug(f'Database schema is at alembic revision(s) {sorted(current)}')
+
+  def load_factions(self) -> None:
+    """Load the whole `factions` table into the faction registry."""
+    with self.engine.connect() as conn:
+      stmt = self.factions.select(
+      ).with_only_columns(
+        self.factions.c.name,
+        self.factions.c.id,
+      )
+
+      self.faction_ids = {r.name: r.id for r in conn.execute(stmt)}
+
+    self.logger.debug(f'Loaded {len(self.faction_ids)} factions into registry')
+
+  @contextlib.contextmanager
+  def unit_of_work(self) -> Iterator[sqlalchemy.engine.base.Connection]:
     """
-    Record the given faction name in the database.
+    Provide a single connection and transaction for a batch of writes.
 
-    :param faction_name:
-    :returns: id of the faction
+    Pass the yielded connection as `conn` to the `record_*()` methods so
+    that, e.g., a whole system document is written atomically.  Any error
+    rolls back everything written through it.
     """
-    # Attempt to INSERT
-    with self.engine.connect() as conn:
-      stmt = self.factions.insert().values(
-        name=faction_name
+    try:
+      with self.engine.begin() as conn:
+        yield conn
+
+    except Exception:
+      # Any factions first recorded in the rolled back transaction don't
+      # exist after all.
+      self.load_factions()
+      raise
+
+  @contextlib.contextmanager
+  def transaction(
+    self, conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> Iterator[sqlalchemy.engine.base.Connection]:
+    """
+    Use the given connection, else a new one in its own transaction.
+
+    :param conn: DB connection, from `unit_of_work()`, if any.
+    """
+    if conn is not None:
+      yield conn
+      return
+
+    with self.engine.begin() as conn:
+      yield conn
+
+  def record_factions(
+    self, faction_names: Iterable[str], conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> Dict[str, int]:
+    """
+    Ensure all of the given faction names are in the database.
+
+    Any names not already in the registry are upserted in a single
+    statement, with their ids coming straight back via RETURNING.
+
+    :param faction_names: Names of the factions.
+    :param conn: DB connection - we might be called within a transaction.
+    :returns: `dict` of faction name -> our DB id.
+    """
+    faction_names = list(faction_names)
+    # Sorted so that concurrent runs always take row locks in the same order.
+    missing = sorted({n for n in faction_names if n not in self.faction_ids})
+    if missing:
+      stmt = insert(self.factions).values(
+        [{'name': n} for n in missing]
+      )
+      # DO NOTHING wouldn't RETURN rows that already exist, so 'update'
+      # the name to itself instead.
+      stmt = stmt.on_conflict_do_update(
+        constraint='factions_pkey',
+        set_={'name': stmt.excluded.name},
+      ).returning(
+        self.factions.c.name,
+        self.factions.c.id,
       )
 
-      try:
-        result = conn.execute(stmt)
+      with self.transaction(conn) as conn:
+        for r in conn.execute(stmt):
+          self.faction_ids[r.name] = r.id
 
-      except sqlalchemy.exc.IntegrityError:
-        # Assume already present
-        pass
+    return {n: self.faction_ids[n] for n in faction_names}
 
-    # Retrieve the `id` value for this faction
-    with self.engine.connect() as conn:
-      stmt = self.factions.select().where(self.factions.c.name == faction_name)
-      result = conn.execute(stmt)
-      return result.first()._mapping['id']
+  def record_faction(
+    self, faction_name: str, conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> Optional[int]:
+    """
+    Record the given faction name in the database.
 
-    return None
+    :param faction_name:
+    :param conn: DB connection - we might be called within a transaction.
+    :returns: id of the faction
+    """
+    return self.record_factions([faction_name], conn=conn)[faction_name]
 
-  def record_factions_presences(self, system_id: int, factions: dict) -> None:
+  def record_factions_presences(
+    self, system_id: int, factions: list, conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> None:
     """
-    Record data for given faction in a specific system.
+    Record data for all the factions present in a specific system.
+
+    The new data is diffed against what's already stored, so only
+    retreated, newly arrived, or changed factions are actually written.
 
     :param system_id: System id.
-    :param data: Array of faction data dicts.
+    :param factions: Array of faction data dicts.
+    :param conn: DB connection - we might be called within a transaction.
     """
-    with self.engine.begin() as conn:
-      # First remove all factions from the given system so we take note of
-      # retreats.
-      stmt = delete(self.factions_presences).where(
+    with self.transaction(conn) as conn:
+      stmt = self.factions_presences.select(
+      ).where(
         self.factions_presences.c.systemaddress == system_id
       )
-      conn.execute(stmt)
-      # self.logger.debug(f'{result.rowcount} factions deleted from {system_id}')
+      existing = {r.faction_id: r._mapping for r in conn.execute(stmt)}
+      current = {f['faction_id']: f for f in factions}
 
-      # Now add the ones currently known to be in that system.
-      for f in factions:
-        stmt = insert(self.factions_presences).values(f)
-
-        # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+      # Remove any factions no longer in the system so we take note of
+      # retreats.
+      retreated = existing.keys() - current.keys()
+      if retreated:
+        stmt = delete(self.factions_presences).where(
+          self.factions_presences.c.systemaddress == system_id
+        ).where(
+          self.factions_presences.c.faction_id.in_(sorted(retreated))
+        )
         conn.execute(stmt)
+        # self.logger.debug(f'{len(retreated)} factions deleted from {system_id}')
+
+      # Add any that have newly expanded in, as a single multi-row INSERT.
+      added = [f for faction_id, f in current.items() if faction_id not in existing]
+      if added:
+        conn.execute(insert(self.factions_presences).values(added))
+
+      # And update those whose data has changed, all in one executemany.
+      changed = [
+        f for faction_id, f in current.items()
+        if faction_id in existing
+        and any(existing[faction_id][c] != f[c] for c in self.PRESENCE_DATA_COLUMNS)
+      ]
+      if changed:
+        stmt = self.factions_presences.update(
+        ).where(
+          self.factions_presences.c.systemaddress == bindparam('b_systemaddress')
+        ).where(
+          self.factions_presences.c.faction_id == bindparam('b_faction_id')
+        ).values(
+          {c: bindparam(f'b_{c}') for c in self.PRESENCE_DATA_COLUMNS}
+        )
+        conn.execute(stmt, [{f'b_{k}': v for k, v in f.items()} for f in changed])
 
   def record_faction_presence(self, faction_id: int, data: dict) -> None:
     """
@@ -279,48 +449,123 @@ class Database(object):
         self.logger.error('IntegrityError inserting faction presence data')
         return None
 
-  def record_system(self, system_data: dict) -> Optional[int]:
+  def record_system(
+    self, system_data: dict, conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> Optional[sqlalchemy.engine.Row]:
     """
     Record the given system data in the database.
 
     :param system_data: `dict` with key:value per database column.
+    :param conn: DB connection - we might be called within a transaction.
     :returns: The database data for that system.
     """
-    # Attempt to INSERT
-    with self.engine.connect() as conn:
-      stmt = insert(self.systems).values(
-        systemaddress=system_data['systemaddress'],
-        name=system_data['name'],
-        starpos_x=system_data['starpos_x'],
-        starpos_y=system_data['starpos_y'],
-        starpos_z=system_data['starpos_z'],
-        system_allegiance=system_data['system_allegiance'],
-        system_economy=system_data['system_economy'],
-        system_secondary_economy=system_data['system_secondary_economy'],
-        system_controlling_faction=system_data['system_controlling_faction'],
-        system_government=system_data['system_government'],
-        system_security=system_data['system_security'],
-        last_updated=system_data['last_updated'],
-      ).on_conflict_do_update(
-        constraint='systems_pkey',
-        set_=system_data
-      )
+    systems = self.record_systems([system_data], conn=conn)
+    if systems is None:
+      return None
 
-      try:
-        result = conn.execute(stmt)
+    return systems.get(system_data['systemaddress'])
 
-      except sqlalchemy.exc.IntegrityError:
-        # Assume already present
-        self.logger.error('IntegrityError inserting system data')
-        return None
+  def record_systems(
+    self, systems_data: list, conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> Optional[Dict[int, sqlalchemy.engine.Row]]:
+    """
+    Record the given systems' data in the database, in a single statement.
 
-    # Retrieve the `id` value for this system
-    with self.engine.connect() as conn:
-      stmt = self.systems.select().where(self.systems.c.systemaddress == system_data['systemaddress'])
-      result = conn.execute(stmt)
-      return result.first()
+    :param systems_data: `list` of `dict` with key:value per database column.
+      All must have the same keys.
+    :param conn: DB connection - we might be called within a transaction.
+    :returns: `dict` of systemaddress -> the database data for that system.
+    """
+    if not systems_data:
+      return {}
+
+    # A system can only be affected once by an INSERT ... ON CONFLICT, so
+    # only the last data for any system is used.
+    rows = list({d['systemaddress']: d for d in systems_data}.values())
+
+    stmt = insert(self.systems).values(rows)
+    stmt = stmt.on_conflict_do_update(
+      constraint='systems_pkey',
+      set_={k: stmt.excluded[k] for k in rows[0].keys() if k != 'systemaddress'},
+    ).returning(
+      *self.systems.c
+    )
+
+    try:
+      with self.transaction(conn) as c:
+        return {r.systemaddress: r for r in c.execute(stmt)}
+
+    except sqlalchemy.exc.IntegrityError:
+      if conn is not None:
+        # Leave it to the caller's unit of work to roll back.
+        raise
+
+      # Assume already present
+      self.logger.error('IntegrityError inserting system data')
+      return None
+
+  def record_faction_states(
+    self, faction_id: int, presences: Dict[int, Dict[str, list]],
+    conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> None:
+    """
+    Update database for the active, pending and recovering states of a faction.
 
-    return None
+    All the given systems are handled in one transaction, and only the
+    (system, state) rows that have actually changed are written.
+
+    :param faction_id: Our DB id of the faction.
+    :param presences: `dict` of system id -> `dict` of state kind
+      ('active', 'pending' or 'recovering') -> list of current states.
+      A kind that isn't present for a system is left untouched.
+    :param conn: DB connection - we might be called within a transaction.
+    """
+    if not presences:
+      return
+
+    with self.transaction(conn) as conn:
+      for kind, table in self.faction_state_tables.items():
+        systems = [s for s, p in presences.items() if kind in p]
+        if not systems:
+          continue
+
+        stmt = table.select(
+        ).with_only_columns(
+          table.c.systemaddress,
+          table.c.state,
+        ).where(
+          table.c.faction_id == faction_id
+        ).where(
+          table.c.systemaddress.in_(systems)
+        )
+        stored = {(r.systemaddress, r.state) for r in conn.execute(stmt)}
+        current = {(s, state) for s in systems for state in presences[s][kind]}
+
+        # States that have ended
+        ended = stored - current
+        if ended:
+          conn.execute(
+            delete(table).where(
+              table.c.faction_id == faction_id
+            ).where(
+              tuple_(table.c.systemaddress, table.c.state).in_(sorted(ended))
+            )
+          )
+
+        # States that have started
+        started = current - stored
+        if started:
+          conn.execute(
+            insert(table).values(
+              [
+                {
+                  'faction_id': faction_id,
+                  'systemaddress': s,
+                  'state': state,
+                } for s, state in sorted(started)
+              ]
+            )
+          )
 
   def record_faction_active_states(self, faction_id: int, system_id: int, states: list) -> None:
     """
@@ -330,25 +575,7 @@ class Database(object):
     :param system_id: The system if this is for.
     :param states: List of currently active states.
     """
-    # We need a transaction for this
-    with self.engine.begin() as conn:
-      # First clear all the states for this (faction, system) tuple
-      conn.execute(
-        delete(self.factions_active_states).where(
-          self.factions_active_states.c.faction_id == faction_id
-        ).where(
-          self.factions_active_states.c.systemaddress == system_id
-        )
-      )
-      # Now add in all of the specified ones.
-      for a_state in states:
-        conn.execute(
-          insert(self.factions_active_states).values(
-            faction_id=faction_id,
-            systemaddress=system_id,
-            state=a_state,
-          )
-        )
+    self.record_faction_states(faction_id, {system_id: {'active': states}})
 
   def record_faction_pending_states(self, faction_id: int, system_id: int, states: list) -> None:
     """
@@ -358,25 +585,7 @@ class Database(object):
     :param system_id: The system if this is for.
     :param states: List of currently pending states.
     """
-    # We need a transaction for this
-    with self.engine.begin() as conn:
-      # First clear all the states for this (faction, system) tuple
-      conn.execute(
-        delete(self.factions_pending_states).where(
-          self.factions_pending_states.c.faction_id == faction_id
-        ).where(
-          self.factions_pending_states.c.systemaddress == system_id
-        )
-      )
-      # Now add in all of the specified ones.
-      for a_state in states:
-        conn.execute(
-          insert(self.factions_pending_states).values(
-            faction_id=faction_id,
-            systemaddress=system_id,
-            state=a_state,
-          )
-        )
+    self.record_faction_states(faction_id, {system_id: {'pending': states}})
 
   def record_faction_recovering_states(self, faction_id: int, system_id: int, states: list) -> None:
     """
@@ -386,35 +595,21 @@ class Database(object):
     :param system_id: The system if this is for.
     :param states: List of currently recovering states.
     """
-    # We need a transaction for this
-    with self.engine.begin() as conn:
-      # First clear all the states for this (faction, system) tuple
-      conn.execute(
-        delete(self.factions_recovering_states).where(
-          self.factions_recovering_states.c.faction_id == faction_id
-        ).where(
-          self.factions_recovering_states.c.systemaddress == system_id
-        )
-      )
-      # Now add in all of the specified ones.
-      for a_state in states:
-        conn.execute(
-          insert(self.factions_recovering_states).values(
-            faction_id=faction_id,
-            systemaddress=system_id,
-            state=a_state,
-          )
-        )
+    self.record_faction_states(faction_id, {system_id: {'recovering': states}})
 
-  def record_conflict(self, system_id: int, last_updated: str, conflict: dict) -> None:
+  def record_conflict(
+    self, system_id: int, last_updated: str, conflict: dict,
+    conn: Optional[sqlalchemy.engine.base.Connection] = None
+  ) -> None:
     """
     Record current state of a conflict for the faction in a system.
 
     :param system_id: The system if this is for.
     :param last_updated: `str` - from elitebgs.app API systems data.
     :param conflict: `dict` of conflict data from elitebgs.app API.
+    :param conn: DB connection - we might be called within a transaction.
     """
-    with self.engine.begin() as conn:
+    with self.transaction(conn) as c:
       # We need the two factions to always be in the same order otherwise
       # the unique constraint won't always work.
       if conflict['faction1']['name'] > conflict['faction2']['name']:
@@ -422,8 +617,12 @@ class Database(object):
         conflict['faction2'] = conflict['faction1'].copy()
         conflict['faction1'] = f
 
-      faction1_id = self.record_faction(conflict['faction1']['name'])
-      faction2_id = self.record_faction(conflict['faction2']['name'])
+      faction_ids = self.record_factions(
+        [conflict['faction1']['name'], conflict['faction2']['name']],
+        conn=c
+      )
+      faction1_id = faction_ids[conflict['faction1']['name']]
+      faction2_id = faction_ids[conflict['faction2']['name']]
 
       # Insert or update data for this conflict
       data = {
@@ -444,17 +643,21 @@ class Database(object):
       )
 
       try:
-        result = conn.execute(stmt)
+        result = c.execute(stmt)
         conflict_id = result.inserted_primary_key[0]
 
       except sqlalchemy.exc.IntegrityError:
+        if conn is not None:
+          # Leave it to the caller's unit of work to roll back.
+          raise
+
         # Assume already present
         self.logger.error('IntegrityError inserting conflict data')
         return None
 
       # Update the factions_conflicts table as well.
-      self.record_faction_conflict(conn, faction1_id, conflict_id)
-      self.record_faction_conflict(conn, faction2_id, conflict_id)
+      self.record_faction_conflict(c, faction1_id, conflict_id)
+      self.record_faction_conflict(c, faction2_id, conflict_id)
 
   def record_faction_conflict(
     self,
@@ -487,6 +690,9 @@ class Database(object):
     :param faction_name: `str` - faction of interest.
     :returns: `int` - Our DB ID for this faction.
     """
+    if faction_name in self.faction_ids:
+      return self.faction_ids[faction_name]
+
     with self.engine.connect() as conn:
       stmt = self.factions.select(
       ).where(
@@ -498,7 +704,42 @@ class Database(object):
       if result.rowcount != 1:
         return None
 
-      return result.first()['id']
+      faction_id = result.first()['id']
+      self.faction_ids[faction_name] = faction_id
+
+      return faction_id
+
+  def record_ticks(self, ticks: Iterable[datetime.datetime]) -> None:
+    """
+    Record the given ticks, ignoring any already known.
+
+    :param ticks: `datetime` of the ticks.
+    """
+    # Stored as naive UTC, as with all our other timestamps.
+    rows = [
+      {'time': t.astimezone(datetime.timezone.utc).replace(tzinfo=None)} for t in ticks
+    ]
+    if not rows:
+      return
+
+    with self.engine.begin() as conn:
+      conn.execute(insert(self.ticks).values(rows).on_conflict_do_nothing())
+
+  def ticks_since(self, since: Optional[datetime.datetime] = None) -> list:
+    """
+    Return all the recorded ticks since the given time.
+
+    :param since: Optional `datetime`, else all ticks.
+    :returns: `list` of UTC `datetime` of ticks, oldest first.
+    """
+    stmt = self.ticks.select().order_by(self.ticks.c.time.asc())
+    if since is not None:
+      stmt = stmt.where(
+        self.ticks.c.time > since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+      )
+
+    with self.engine.connect() as conn:
+      return [r.time.replace(tzinfo=datetime.timezone.utc) for r in conn.execute(stmt)]
 
   def expire_conflicts(self) -> int:
     """Remove data for any conflicts that have expired."""
@@ -517,6 +758,27 @@ class Database(object):
 
       return result.rowcount
 
+  def systems_by_name(
+    self, names: Iterable[str], columns: Iterable[str] = ('systemaddress', 'last_updated')
+  ) -> Dict[str, sqlalchemy.engine.Row]:
+    """
+    Look up the given systems by name.
+
+    :param names: Names of the systems.
+    :param columns: Names of the `systems` columns wanted, besides `name`.
+    :returns: `dict` of name -> row of (name, *columns), for those we know.
+    """
+    stmt = self.systems.select(
+    ).with_only_columns(
+      self.systems.c.name,
+      *(self.systems.c[c] for c in columns),
+    ).where(
+      self.systems.c.name.in_(list(names))
+    )
+
+    with self.engine.connect() as conn:
+      return {r.name: r for r in conn.execute(stmt)}
+
   def systems_older_than(self, since: datetime.datetime, faction_id: int = None) -> list:
     """
     Return a list of systems with latest data older than specified.
@@ -525,36 +787,87 @@ class Database(object):
     :param faction_id: Optional faction to filter systems for presence.
     :returns: `list` of system rows, in ascending last_updated order.
     """
+    return list(self.iter_systems_older_than(since, faction_id=faction_id))
+
+  def iter_systems_older_than(
+    self, since: datetime.datetime, faction_id: int = None,
+    columns: Optional[Iterable[str]] = None, yield_per: int = 1000,
+    faction_ids: Optional[Iterable[int]] = None
+  ) -> Generator[sqlalchemy.engine.Row, None, None]:
+    """
+    Stream systems with latest data older than specified.
+
+    Rows are fetched from a server-side cursor, `yield_per` at a time, so
+    the whole result is never held in memory.
+
+    :param since: `datetime` of oldest data to not need updating.
+    :param faction_id: Optional faction to filter systems for presence.
+    :param columns: Optional names of the `systems` columns wanted, else all.
+    :param yield_per: How many rows to fetch from the server at a time.
+    :param faction_ids: Alternatively, several factions, any of which must
+      be present.
+    :returns: system rows, in ascending last_updated order.
+    """
     # self.logger.debug(f'Finding systems older than {since}')
-    systems = []
+    stmt = self.systems.select()
+    if columns is not None:
+      stmt = stmt.with_only_columns(*(self.systems.c[c] for c in columns))
 
-    with self.engine.connect() as conn:
-      stmt = self.systems.select()
-
-      if faction_id is not None:
-        stmt = stmt.where(
-          self.systems.c.systemaddress.in_(
-            self.factions_presences.select(
-            ).with_only_columns(
-              self.factions_presences.c.systemaddress
-            ).where(
-              self.factions_presences.c.faction_id == faction_id
-            )
-          )
-        )
+    if faction_id is not None:
+      faction_ids = [faction_id]
 
+    if faction_ids is not None:
       stmt = stmt.where(
-        self.systems.c.last_updated < since
-      ).order_by(
-        self.systems.c.last_updated.asc()
+        self.systems.c.systemaddress.in_(
+          self.factions_presences.select(
+          ).with_only_columns(
+            self.factions_presences.c.systemaddress
+          ).where(
+            self.factions_presences.c.faction_id.in_(list(faction_ids))
+          )
+        )
       )
 
-      # self.logger.debug(f'Statement:\n{str(stmt)}\n')
-      result = conn.execute(stmt)
-      for r in result.fetchall():
-        systems.append(r)
+    stmt = stmt.where(
+      self.systems.c.last_updated < since
+    ).order_by(
+      self.systems.c.last_updated.asc()
+    )
 
-    return systems
+    # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+    yield from self.stream(stmt, yield_per)
+
+  def iter_factions_systems_older_than(
+    self, since: datetime.datetime, faction_ids: Iterable[int],
+    columns: Iterable[str] = ('systemaddress', 'name', 'last_updated'), yield_per: int = 1000
+  ) -> Generator[sqlalchemy.engine.Row, None, None]:
+    """
+    Stream the systems, with latest data older than specified, each faction is in.
+
+    A system is included once for each of the given factions present in it.
+
+    :param since: `datetime` of oldest data to not need updating.
+    :param faction_ids: Our DB ids of the factions.
+    :param columns: Names of the `systems` columns wanted.
+    :param yield_per: How many rows to fetch from the server at a time.
+    :returns: rows of (faction_id, *columns), in ascending last_updated order.
+    """
+    stmt = select(
+      self.factions_presences.c.faction_id,
+      *(self.systems.c[c] for c in columns),
+    ).join_from(
+      self.factions_presences, self.systems,
+      self.factions_presences.c.systemaddress == self.systems.c.systemaddress
+    ).where(
+      self.factions_presences.c.faction_id.in_(list(faction_ids))
+    ).where(
+      self.systems.c.last_updated < since
+    ).order_by(
+      self.systems.c.last_updated.asc()
+    )
+
+    # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+    yield from self.stream(stmt, yield_per)
 
   def systems_conflicts_older_than(self, since: datetime.datetime, faction_id: int = None) -> list:
     """
@@ -564,47 +877,106 @@ class Database(object):
     :param faction_id: Faction ID to limit involved to, if specified.
     :returns: `list` of system rows
     """
-    systems = []
+    return list(self.iter_systems_conflicts_older_than(since, faction_id=faction_id))
 
-    with self.engine.connect() as conn:
-      # SELECT name FROM systems
-      #  WHERE systemaddress IN
-      #   (SELECT systemaddress FROM conflicts WHERE ( faction1_id = 1 OR faction2_id = 1 )
-      #  AND status != '' AND last_updated < TIMESTAMP '2021-06-24 23:22:00Z');
-      inner_stmt = self.conflicts.select(
-      ).with_only_columns(
-        self.conflicts.c.systemaddress
-      ).where(
-        self.conflicts.c.last_updated < since
-      ).where(
-        self.conflicts.c.status != ''
-      )
+  def iter_systems_conflicts_older_than(
+    self, since: datetime.datetime, faction_id: int = None,
+    columns: Iterable[str] = ('name',), yield_per: int = 1000
+  ) -> Generator[sqlalchemy.engine.Row, None, None]:
+    """
+    Stream systems with conflicts with data older than specified.
 
-      if faction_id is not None:
-        inner_stmt = inner_stmt.where(
-          or_(
-            self.conflicts.c.faction1_id == faction_id,
-            self.conflicts.c.faction2_id == faction_id
-          )
+    :param since: `datetime` of oldest data to not need updating.
+    :param faction_id: Faction ID to limit involved to, if specified.
+    :param columns: Names of the `systems` columns wanted.
+    :param yield_per: How many rows to fetch from the server at a time.
+    :returns: system rows
+    """
+    # SELECT name FROM systems
+    #  WHERE systemaddress IN
+    #   (SELECT systemaddress FROM conflicts WHERE ( faction1_id = 1 OR faction2_id = 1 )
+    #  AND status != '' AND last_updated < TIMESTAMP '2021-06-24 23:22:00Z');
+    inner_stmt = self.conflicts.select(
+    ).with_only_columns(
+      self.conflicts.c.systemaddress
+    ).where(
+      self.conflicts.c.last_updated < since
+    ).where(
+      self.conflicts.c.status != ''
+    )
+
+    if faction_id is not None:
+      inner_stmt = inner_stmt.where(
+        or_(
+          self.conflicts.c.faction1_id == faction_id,
+          self.conflicts.c.faction2_id == faction_id
         )
+      )
 
-      # self.logger.debug(f'Statement:\n{str(inner_stmt)}\n')
+    # self.logger.debug(f'Statement:\n{str(inner_stmt)}\n')
 
-      stmt = self.systems.select(
-      ).with_only_columns(
-        self.systems.c.name
-      ).where(
-        self.systems.c.systemaddress.in_(
-          inner_stmt
+    stmt = self.systems.select(
+    ).with_only_columns(
+      *(self.systems.c[c] for c in columns)
+    ).where(
+      self.systems.c.systemaddress.in_(
+        inner_stmt
+      )
+    )
+    # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+
+    yield from self.stream(stmt, yield_per)
+
+  def conflicts_older_than(self, since: datetime.datetime, faction_ids: Optional[Iterable[int]] = None) -> list:
+    """
+    Return the conflicts, not yet over, with data older than specified.
+
+    :param since: `datetime` of oldest data to not need updating.
+    :param faction_ids: Factions to limit involved to, if specified.
+    :returns: `list` of conflicts rows, plus the system `name`.
+    """
+    stmt = select(
+      self.conflicts,
+      self.systems.c.name,
+    ).join_from(
+      self.conflicts, self.systems,
+      self.conflicts.c.systemaddress == self.systems.c.systemaddress
+    ).where(
+      self.conflicts.c.last_updated < since
+    ).where(
+      self.conflicts.c.status != ''
+    )
+
+    if faction_ids is not None:
+      faction_ids = list(faction_ids)
+      stmt = stmt.where(
+        or_(
+          self.conflicts.c.faction1_id.in_(faction_ids),
+          self.conflicts.c.faction2_id.in_(faction_ids)
         )
       )
-      # self.logger.debug(f'Statement:\n{str(stmt)}\n')
 
-      result = conn.execute(stmt)
-      for r in result.fetchall():
-        systems.append(r)
+    with self.engine.connect() as conn:
+      return conn.execute(stmt).all()
 
-    return systems
+  def stream(
+    self, stmt: 'sqlalchemy.sql.Select', yield_per: int = 1000
+  ) -> Generator[sqlalchemy.engine.Row, None, None]:
+    """
+    Execute a SELECT using a server-side cursor, yielding rows as they arrive.
+
+    :param stmt: The statement to execute.
+    :param yield_per: How many rows to fetch from the server at a time.
+    :returns: result rows
+    """
+    with self.engine.connect() as conn:
+      result = conn.execution_options(
+        stream_results=True,
+        max_row_buffer=yield_per,
+      ).execute(stmt)
+
+      for partition in result.partitions(yield_per):
+        yield from partition
 
   def system_factions_data(self, systemaddress: int) -> list:
     """
@@ -623,3 +995,154 @@ class Database(object):
 
       # self.logger.debug(f'Statement:\n{str(stmt)}\n')
       return conn.execute(stmt).all()
+
+  def systems_factions_data(self, systemaddresses: Iterable[int]) -> Dict[int, list]:
+    """
+    Accumulate all the per-faction data for the given systems, in one query.
+
+    :param systemaddresses: IDs of the systems.
+    :returns: `dict` of systemaddress -> `list` of factions_presences rows,
+      in ascending influence order.
+    """
+    systems: Dict[int, list] = {s: [] for s in systemaddresses}
+    if not systems:
+      return systems
+
+    stmt = self.factions_presences.select(
+    ).where(
+      self.factions_presences.c.systemaddress.in_(list(systems))
+    ).order_by(
+      self.factions_presences.c.systemaddress.asc(),
+      self.factions_presences.c.influence.asc(),
+    )
+
+    # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+    for r in self.stream(stmt):
+      systems[r.systemaddress].append(r)
+
+    return systems
+
+  def systems_conflicts(self, systemaddresses: Iterable[int]) -> Dict[int, list]:
+    """
+    Gather the known, not yet over, conflicts in the given systems, in one query.
+
+    :param systemaddresses: IDs of the systems.
+    :returns: `dict` of systemaddress -> `list` of conflicts rows.
+    """
+    systems: Dict[int, list] = {s: [] for s in systemaddresses}
+    if not systems:
+      return systems
+
+    stmt = self.conflicts.select(
+    ).where(
+      self.conflicts.c.systemaddress.in_(list(systems))
+    ).where(
+      self.conflicts.c.status != ''
+    )
+
+    for r in self.stream(stmt):
+      systems[r.systemaddress].append(r)
+
+    return systems
+
+  def systems_in_danger_of_conflict(
+    self, since: datetime.datetime, faction_id: Optional[int], ticks: Iterable[datetime.datetime],
+    gap: float = 0.05, growth: float = 0.05, min_influence: float = 0.07,
+    faction_ids: Optional[Iterable[int]] = None
+  ) -> list:
+    """
+    Find stale systems where another faction could now be close to the given one.
+
+    This is `BGS.stale_danger_of_conflicts_projected()` done in the
+    database, so only the dangerous (system, rival faction) pairs come back.
+
+    For each system not updated since `since` the ticks elapsed since its
+    `last_updated` are counted.  A rival below the faction is then assumed to
+    grow by up to `growth` per tick, and is dangerous if at any tick up to the
+    last it gets within `gap` of the faction, which is assumed to not have
+    changed.  A rival already above is dangerous if within `gap`.
+
+    :param since: `datetime` of oldest data to not need updating.
+    :param faction_id: Our DB id of the faction of interest.
+    :param ticks: `datetime` of all the ticks since the oldest such system's
+      last update.
+    :param gap: Influence difference that is considered dangerous.
+    :param growth: Maximum influence growth per tick.
+    :param min_influence: Below this influence the faction can't get into
+      conflicts, so the system is ignored.
+    :param faction_ids: Alternatively, several factions of interest, each
+      checked as if on its own, in the one query.
+    :returns: `list` of rows of (systemaddress, name, last_updated,
+      interest_faction_id, faction_id, gap), where `faction_id` is the rival
+      and `gap` is the faction of interest's influence minus the rival's,
+      oldest data first.
+    """
+    if faction_id is not None:
+      faction_ids = [faction_id]
+
+    if faction_ids is None:
+      raise ValueError('One of faction_id or faction_ids is required')
+
+    # Our last_updated columns are naive UTC.
+    ticks = [t.astimezone(datetime.timezone.utc).replace(tzinfo=None) for t in ticks]
+
+    # How many ticks since each stale system was updated ?
+    tick = func.unnest(bindparam('ticks', value=ticks, type_=ARRAY(DateTime))).column_valued('tick')
+    ticks_since = select(
+      func.count()
+    ).where(
+      tick > self.systems.c.last_updated
+    ).scalar_subquery()
+
+    stale = select(
+      self.systems.c.systemaddress,
+      self.systems.c.name,
+      self.systems.c.last_updated,
+      ticks_since.label('ticks_since'),
+    ).where(
+      self.systems.c.last_updated < since
+    ).cte('stale')
+
+    us = self.factions_presences.alias('us')
+    them = self.factions_presences.alias('them')
+
+    # Could a rival below us reach us at any tick from 1 up to, but not
+    # including, ticks_since ?  Stepping tick by tick, as in the reference,
+    # in case of an overshoot.
+    t = func.generate_series(1, stale.c.ticks_since - 1).column_valued('t')
+    could_reach = exists().where(
+      func.abs(us.c.influence - (them.c.influence + growth * t)) < gap
+    )
+
+    stmt = select(
+      stale.c.systemaddress,
+      stale.c.name,
+      stale.c.last_updated,
+      us.c.faction_id.label('interest_faction_id'),
+      them.c.faction_id,
+      (us.c.influence - them.c.influence).label('gap'),
+    ).select_from(
+      stale.join(
+        us, and_(us.c.systemaddress == stale.c.systemaddress, us.c.faction_id.in_(list(faction_ids)))
+      ).join(
+        them, and_(them.c.systemaddress == stale.c.systemaddress, them.c.faction_id != us.c.faction_id)
+      )
+    ).where(
+      us.c.influence >= min_influence
+    ).where(
+      or_(
+        # It's above us, and we assume we don't grow.
+        and_(them.c.influence >= us.c.influence, func.abs(us.c.influence - them.c.influence) < gap),
+        # It's below 'us', so what *could* it be now ?
+        and_(them.c.influence < us.c.influence, could_reach),
+      )
+    ).order_by(
+      stale.c.last_updated.asc(),
+      stale.c.systemaddress.asc(),
+      us.c.faction_id.asc(),
+      them.c.faction_id.asc(),
+    )
+
+    # self.logger.debug(f'Statement:\n{str(stmt)}\n')
+    with self.engine.connect() as conn:
+      return conn.execute(stmt).all()
@@ -1,2 +1,4 @@
 """elitebgs.app API module."""
+from ed_bgs.elitebgs_app.cache import ResponseCache  # noqa: F401
+from ed_bgs.elitebgs_app.dump import DumpReader  # noqa: F401
 from ed_bgs.elitebgs_app.elitebgs import EliteBGS  # noqa: F401
@@ -0,0 +1,220 @@
+"""
+On-disk cache of elitebgs.app API responses.
+
+Responses are keyed by URL.  A cached response is used as-is if it was
+fetched since the last known tick, and since any time the caller knows the
+document changed, and isn't older than a maximum age.
+Otherwise it's revalidated with a conditional request, using any `ETag` or
+`Last-Modified` the API gave, so an unchanged document costs only a 304.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING, Optional
+
+import requests
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+
+  from ed_bgs.client import HttpClient
+# isort on
+
+
+class ResponseCache:
+  """On-disk HTTP response cache, keyed by URL."""
+
+  def __init__(
+    self, logger: 'logging.Logger', directory: str,
+    max_age: datetime.timedelta = datetime.timedelta(hours=1), compress: bool = False
+  ):
+    """
+    Initialise the cache.
+
+    :param logger: `logging.Logger` instance.
+    :param directory: Where to store the cached responses.
+    :param max_age: The longest a response is used without revalidating it.
+    :param compress: Whether to gzip the stored response bodies.
+    """
+    self.logger = logger
+    self.directory = directory
+    self.max_age = max_age
+    self.compress = compress
+
+    # Responses fetched before this are always revalidated.
+    self.last_tick: Optional[datetime.datetime] = None
+
+    os.makedirs(self.directory, exist_ok=True)
+
+  @classmethod
+  def from_config(cls, logger: 'logging.Logger', cache_config: Optional[dict]) -> Optional['ResponseCache']:
+    """
+    Set up a cache as per the `elitebgs: cache:` configuration, if any.
+
+    :param logger: `logging.Logger` instance.
+    :param cache_config: The `cache` config `dict`.
+    :returns: The cache, else `None` if not configured.
+    """
+    if not cache_config:
+      return None
+
+    return cls(
+      logger,
+      cache_config['directory'],
+      max_age=datetime.timedelta(minutes=cache_config.get('max_age_minutes', 60)),
+      compress=cache_config.get('compress', False),
+    )
+
+  def _path(self, url: str) -> str:
+    """Return the path, minus extension, for the cache entry of a URL."""
+    return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+  def _load(self, url: str) -> Optional[dict]:
+    """
+    Load the metadata for the cache entry of a URL.
+
+    :param url: The URL.
+    :returns: `dict` of metadata, if there's a (valid) entry.
+    """
+    try:
+      with open(f'{self._path(url)}.json', 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    except (OSError, ValueError):
+      return None
+
+    if meta.get('url') != url:
+      return None
+
+    return meta
+
+  def _body(self, url: str, meta: dict) -> Optional[bytes]:
+    """
+    Load the body of the cache entry for a URL.
+
+    :param url: The URL.
+    :param meta: The entry's metadata.
+    :returns: The response body, if still present.
+    """
+    try:
+      if meta['compressed']:
+        with gzip.open(f'{self._path(url)}.body.gz', 'rb') as f:
+          return f.read()
+
+      with open(f'{self._path(url)}.body', 'rb') as f:
+        return f.read()
+
+    except OSError:
+      return None
+
+  def _write(self, path: str, data: bytes) -> None:
+    """Atomically write data to a file in the cache directory."""
+    fd, tmp = tempfile.mkstemp(dir=self.directory)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+      os.replace(tmp, path)
+
+    except OSError:
+      os.unlink(tmp)
+      raise
+
+  def _store(self, url: str, meta: dict, body: Optional[bytes] = None) -> None:
+    """
+    Store a cache entry for a URL.
+
+    :param url: The URL.
+    :param meta: The entry's metadata.
+    :param body: The response body, if it's changed.
+    """
+    path = self._path(url)
+    if body is not None:
+      if meta['compressed']:
+        self._write(f'{path}.body.gz', gzip.compress(body))
+
+      else:
+        self._write(f'{path}.body', body)
+
+    self._write(f'{path}.json', json.dumps(meta).encode())
+
+  def _fresh(
+    self, meta: dict, max_age: datetime.timedelta, tick_bound: bool, newer_than: Optional[datetime.datetime]
+  ) -> bool:
+    """Determine if a cache entry can be used without revalidating it."""
+    fetched = datetime.datetime.fromtimestamp(meta['fetched'], tz=datetime.timezone.utc)
+    if datetime.datetime.now(tz=datetime.timezone.utc) - fetched > max_age:
+      return False
+
+    if tick_bound and self.last_tick is not None and fetched < self.last_tick:
+      return False
+
+    if newer_than is not None and fetched < newer_than:
+      return False
+
+    return True
+
+  def get(
+    self, client: 'HttpClient', url: str,
+    max_age: Optional[datetime.timedelta] = None, tick_bound: bool = True,
+    newer_than: Optional[datetime.datetime] = None
+  ) -> bytes:
+    """
+    Retrieve a URL, using the cache where possible.
+
+    :param client: `HttpClient` to make any request with.
+    :param url: The URL.
+    :param max_age: Override of the cache's `max_age` for this URL.
+    :param tick_bound: Whether a new tick makes the response stale.
+    :param newer_than: When the document is known to have changed, so any
+      response fetched before then is stale.
+    :returns: The response body.
+    :raises requests.exceptions.RequestException: On any request failure.
+    """
+    meta = self._load(url)
+    body = self._body(url, meta) if meta is not None else None
+    if body is None:
+      meta = None
+
+    if meta is not None and self._fresh(
+      meta, max_age if max_age is not None else self.max_age, tick_bound, newer_than
+    ):
+      self.logger.debug(f'Using cached response for {url}')
+      return body  # type: ignore
+
+    headers = {}
+    if meta is not None:
+      if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+
+      if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    r = client.get(url, headers=headers)
+    now = datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+
+    if r.status_code == requests.codes.not_modified and meta is not None:
+      self.logger.debug(f'Cached response for {url} still valid')
+      meta['fetched'] = now
+      self._store(url, meta)
+      return body  # type: ignore
+
+    r.raise_for_status()
+
+    self._store(
+      url,
+      {
+        'url': url,
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'fetched': now,
+        'compressed': self.compress,
+      },
+      r.content,
+    )
+
+    return r.content
@@ -0,0 +1,65 @@
+"""
+Fast decoding of elitebgs.app API responses.
+
+JSON is decoded with `orjson`, else `msgspec`, if installed, falling back
+to the standard library `json`.  Timestamps in the API's fixed format, e.g.
+`2021-06-22T22:15:43.000Z`, are parsed directly, and memoised, as the same
+tick times turn up over and over.  Anything else goes via `isoparse`.
+"""
+import datetime
+import functools
+import json
+from typing import Any, Callable, Tuple, Type, Union
+
+from dateutil.parser import isoparse
+
+try:
+  import orjson
+
+except ImportError:
+  orjson = None
+
+try:
+  import msgspec
+
+except ImportError:
+  msgspec = None
+
+loads: Callable[[Union[bytes, str]], Any]
+# Catch these for any failure to decode.
+JSONDecodeError: Tuple[Type[Exception], ...]
+
+if orjson is not None:
+  loads = orjson.loads
+  JSONDecodeError = (orjson.JSONDecodeError,)
+
+elif msgspec is not None:
+  loads = msgspec.json.decode
+  JSONDecodeError = (msgspec.DecodeError,)
+
+else:
+  loads = json.loads
+  JSONDecodeError = (json.JSONDecodeError,)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_time(timestamp: str) -> datetime.datetime:
+  """
+  Parse an elitebgs.app API timestamp.
+
+  :param timestamp: ISO 8601 timestamp, ideally as `YYYY-MM-DDTHH:MM:SS.mmmZ`.
+  :returns: Timezone aware `datetime.datetime`.
+  :raises ValueError: If it's not a valid timestamp.
+  """
+  if (
+    len(timestamp) == 24 and timestamp[4] == '-' and timestamp[7] == '-' and timestamp[10] == 'T'
+    and timestamp[13] == ':' and timestamp[16] == ':' and timestamp[19] == '.' and timestamp[23] == 'Z'
+  ):
+    return datetime.datetime(
+      int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+      int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]),
+      int(timestamp[20:23]) * 1000,
+      tzinfo=datetime.timezone.utc,
+    )
+
+  return isoparse(timestamp)
@@ -0,0 +1,124 @@
+"""
+Read saved elitebgs.app API output, such as archived factions queries.
+
+The files can be large, so the faction presences are streamed out of them
+one at a time, in constant memory, with `ijson`.  Should it not be
+installed each file is loaded whole, see `decode`.  Files may be gzip or,
+with `zstandard`, zstd compressed.
+"""
+import gzip
+import io
+import os
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, List
+
+from ed_bgs.elitebgs_app import decode
+
+try:
+  import ijson
+
+except ImportError:
+  ijson = None  # type: ignore
+
+try:
+  import zstandard
+
+except ImportError:
+  zstandard = None  # type: ignore
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+# isort on
+
+
+class DumpReader:
+  """Iterate over the contents of saved elitebgs.app API output."""
+
+  GZIP_MAGIC = b'\x1f\x8b'
+  ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+  # Files within directories to read, others are ignored.
+  EXTENSIONS = ('.json', '.json.gz', '.json.zst')
+
+  def __init__(self, logger: 'logging.Logger'):
+    """
+    Initialise the reader.
+
+    :param logger: `logging.Logger` instance.
+    """
+    self.logger = logger
+
+    if ijson is None:
+      self.logger.warning('ijson is not installed, so each file will be loaded whole, into memory')
+
+  def files(self, paths: Iterable[str]) -> List[str]:
+    """
+    Expand a mix of files and directories into a list of files.
+
+    :param paths: File and/or directory names.
+    :returns: The files, with each directory's in name order.
+    """
+    files = []
+    for path in paths:
+      if not os.path.isdir(path):
+        files.append(path)
+        continue
+
+      for name in sorted(os.listdir(path)):
+        if name.endswith(self.EXTENSIONS) and os.path.isfile(os.path.join(path, name)):
+          files.append(os.path.join(path, name))
+
+    return files
+
+  def open(self, path: str) -> BinaryIO:
+    """
+    Open a file, decompressing it if necessary.
+
+    The compression is determined by the file's contents, not its name.
+
+    :param path: The file name.
+    :returns: Binary file object of the uncompressed data.
+    :raises OSError: If the file can't be opened, or is zstd compressed and
+      `zstandard` isn't available.
+    """
+    with open(path, 'rb') as f:
+      magic = f.read(4)
+
+    if magic.startswith(self.GZIP_MAGIC):
+      # Unlike a GzipFile given a fileobj, this closes the file too.
+      return gzip.open(path, 'rb')  # type: ignore
+
+    f = open(path, 'rb')
+    if magic == self.ZSTD_MAGIC:
+      if zstandard is None:
+        f.close()
+        raise OSError(f'{path} is zstd compressed, but zstandard is not installed')
+
+      return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=True))  # type: ignore
+
+    return f
+
+  def presences(self, paths: Iterable[str]) -> Iterator[dict]:
+    """
+    Iterate over all the faction presences in the given files.
+
+    Each file should be the output of an elitebgs.app factions query.  The
+    presences of every faction 'doc' in it are included.  Any file that
+    can't be read is logged and skipped.
+
+    :param paths: File and/or directory names, see `files()`.
+    :returns: elitebgs.app API 'faction_presence' dicts.
+    """
+    for path in self.files(paths):
+      self.logger.debug(f'Reading faction presences from {path}')
+      try:
+        with self.open(path) as f:
+          if ijson is not None:
+            yield from ijson.items(f, 'docs.item.faction_presence.item', use_float=True)
+
+          else:
+            for doc in decode.loads(f.read())['docs']:
+              yield from doc['faction_presence']
+
+      except (OSError, EOFError, ValueError, KeyError) + decode.JSONDecodeError as e:
+        # ijson's errors are ValueErrors
+        self.logger.warning(f'Error reading {path}: {e!r}')
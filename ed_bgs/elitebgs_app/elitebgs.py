@@ -5,106 +5,249 @@ See: https://elitebgs.app/ebgs/docs/V5/
 """
 
 import datetime
-import json
-from typing import TYPE_CHECKING, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
-from dateutil.parser import isoparse
+
+from ed_bgs.bgs.ticks import TickTimeline
+from ed_bgs.client import HttpClient
+from ed_bgs.elitebgs_app import decode
 
 # isort off
 if TYPE_CHECKING:
   import logging
 
+  import sqlalchemy
+
   import ed_bgs.database as database
+  from ed_bgs.elitebgs_app.cache import ResponseCache
 # isort on
 
 
 class EliteBGS:
   """Access to the elitebgs.app API."""
 
-  FACTIONS_URL = 'https://elitebgs.app/api/ebgs/v5/factions'
-  SYSTEMS_URL = 'https://elitebgs.app/api/ebgs/v5/systems'
-  TICKS_URL = 'https://elitebgs.app/api/ebgs/v5/ticks'
+  API_URL = 'https://elitebgs.app/api/ebgs/v5'
+  # New ticks are what makes everything else stale, so only cache briefly.
+  TICKS_MAX_AGE = datetime.timedelta(minutes=5)
 
-  def __init__(self, logger: 'logging.Logger', db: 'database'):
+  def __init__(
+    self, logger: 'logging.Logger', db: 'database', max_workers: int = 1,
+    cache: Optional['ResponseCache'] = None, client: Optional[HttpClient] = None,
+    base_url: str = API_URL
+  ):
     """
     Initialise access to elitebgs.app API.
 
     :param logger: `logging.Logger` instance.
     :param db: `ed_bgs.database` instance.
+    :param max_workers: Maximum number of concurrent requests when fetching
+      a faction's systems.
+    :param cache: Optional `ResponseCache` to use for all requests.
+    :param client: `HttpClient` to make requests with, possibly shared with
+      other APIs, else one is made with default limits.
+    :param base_url: Base URL of the API, for using a stand-in.
     """
     self.logger = logger
     self.db = db
+    self.max_workers = max(1, max_workers)
+    self.cache = cache
+
+    base_url = base_url.rstrip('/')
+    self.factions_url = f'{base_url}/factions'
+    self.systems_url = f'{base_url}/systems'
+    self.ticks_url = f'{base_url}/ticks'
+
+    # Systems already fetched and stored this run, see `start_run()`.
+    self.run_systems: Dict[str, int] = {}
+    self.fetches_saved = 0
+
+    if client is None:
+      client = HttpClient(logger, max_per_host=self.max_workers)
+
+    self.client = client
+
+  def start_run(self) -> None:
+    """
+    Start a new run of updates.
+
+    Within a run any system is only fetched and stored once, no matter how
+    many of the factions being updated are present in it.
+
+    With a cache, the ticks are brought up to date first, so that nothing
+    cached from before the latest tick is used without revalidating it.
+    """
+    self.run_systems = {}
+    self.fetches_saved = 0
+
+    if self.cache is not None:
+      self.tick_timeline(datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1))
+
+  def get(
+    self, url: str, ticks: bool = False, newer_than: Optional[datetime.datetime] = None,
+    revalidate: bool = False
+  ) -> bytes:
+    """
+    Retrieve a URL from the API, via the cache if we have one.
+
+    :param url: The URL.
+    :param ticks: Whether this is a ticks query, cached differently.
+    :param newer_than: When the document is known to have changed, so a
+      response cached before then isn't used.
+    :param revalidate: Whether to always revalidate any cached response.
+    :returns: The response body.
+    :raises requests.exceptions.RequestException: On any request failure.
+    """
+    if self.cache is not None:
+      if ticks:
+        return self.cache.get(self.client, url, max_age=self.TICKS_MAX_AGE, tick_bound=False)
 
-    self.session = requests.Session()
+      return self.cache.get(
+        self.client, url, max_age=datetime.timedelta(0) if revalidate else None, newer_than=newer_than
+      )
+
+    r = self.client.get(url)
+    r.raise_for_status()
+
+    return r.content
 
-  def faction(self, faction_name: str) -> Optional[dict]:
+  def faction(self, faction_name: str, incremental: bool = False) -> Optional[dict]:
     """
     Retrieve, and store, available data about the specified faction.
 
     :param faction_name:
+    :param incremental: Only fetch the systems that elitebgs.app has newer
+      data for, see `presences_to_fetch()`.
     :returns: The elitebgs.app 'document' for the faction.
     """
     self.logger.debug('Attempting to retrieve and store all data for {faction_name}')
 
     try:
-      r = self.session.get(
-        f'{self.FACTIONS_URL}?name={faction_name}'
+      # Incremental updates go by the presences' updated_at, so they need
+      # the current document, not a cached one.
+      content = self.get(
+        f'{self.factions_url}?name={faction_name}',
+        revalidate=incremental,
       )
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
       self.logger.warning(f'Error retrieving faction {faction_name}: {e!r}')
       return None
 
-    # print(r.content.decode())
+    # print(content.decode())
 
     try:
-      data = r.json()
+      data = decode.loads(content)
       f = data['docs'][0]
 
-    except json.JSONDecodeError as e:
+    except decode.JSONDecodeError as e:
       self.logger.warning(f'Error decoding JSON for faction {faction_name}: {e!r}')
       return None
 
     faction_id = self.faction_name_only(faction_name)
 
-    # First ensure all the presence data, particularly active/pending/recovering
-    # states is recorded.
-    for s in f['faction_presence']:
+    presences = f['faction_presence']
+    states = {}
+    if incremental:
+      presences, unchanged = self.presences_to_fetch(presences)
+      self.logger.info(f'{faction_name}: {len(presences)} systems with new data, {len(unchanged)} unchanged')
+
+      # The states of unchanged systems still come from the faction document.
+      for s in f['faction_presence']:
+        if s['system_name'] in unchanged:
+          states[unchanged[s['system_name']]] = self.presence_states(s)
+
+    # Systems already stored this run, for another faction, needn't be fetched
+    # again.
+    already = [s for s in presences if s['system_name'] in self.run_systems]
+    for s in already:
+      states[self.run_systems[s['system_name']]] = self.presence_states(s)
+
+    if already:
+      self.fetches_saved += len(already)
+      presences = [s for s in presences if s['system_name'] not in self.run_systems]
+      self.logger.debug(f'{faction_name}: {len(already)} systems already fetched this run')
+
+    # First ensure all the presence data is recorded, gathering up the
+    # active/pending/recovering states as we go.  The systems might be
+    # fetched concurrently, but they're still stored one at a time, in order.
+    # A system document cached from before the presence was updated is stale.
+    systems_data = self.fetch_systems(
+      (s['system_name'] for s in presences),
+      newer_than={s['system_name']: decode.parse_time(s['updated_at']) for s in presences},
+    )
+    for s, s_data in zip(presences, systems_data):
       self.logger.debug(f'Faction "{faction_name}" - system "{s["system_name"]}"')
 
-      # Ensure the system is in our database.
-      s_data = self.system(s['system_name'])
       if s_data is None:
-        # TODO: Should start using Exceptions for this
-        return None
-
-      # Record any active states
-      self.db.record_faction_active_states(
-        faction_id,
-        s_data['system_address'],
-        [active['state'] for active in s.get('active_states', [])]
-      )
-      # Record any pending states
-      self.db.record_faction_pending_states(
-        faction_id,
-        s_data['system_address'],
-        [pending['state'] for pending in s.get('pending_states', [])]
-      )
-      # Record any recovering states
-      self.db.record_faction_recovering_states(
-        faction_id,
-        s_data['system_address'],
-        [recovering['state'] for recovering in s.get('recovering_states', [])]
-      )
+        # Carry on with the rest, this one will be retried on the next run.
+        self.logger.warning(f'Skipping system "{s["system_name"]}" for faction "{faction_name}"')
+        continue
+
+      # Ensure the system is in our database.
+      with self.db.unit_of_work() as conn:
+        self.store_system(s_data, conn)
 
-      # Conflicts
-      for c in s_data['conflicts']:
-        # Record details of the conflict
-        self.db.record_conflict(s_data['system_address'], s_data['updated_at'], c)
+      self.run_systems[s['system_name']] = s_data['system_address']
+      states[s_data['system_address']] = self.presence_states(s)
+
+    # Now sync all the states for this faction in one go.
+    self.db.record_faction_states(faction_id, states)
 
     return f
 
+  def presence_states(self, presence: dict) -> Dict[str, list]:
+    """
+    Extract the active/pending/recovering states from a faction presence.
+
+    :param presence: elitebgs.app API 'faction_presence' dict.
+    :returns: `dict` of state kind -> list of states, only for the kinds
+      the presence has.
+    """
+    return {
+      kind: [s['state'] for s in presence[f'{kind}_states']]
+      for kind in ('active', 'pending', 'recovering')
+      if f'{kind}_states' in presence
+    }
+
+  def presences_to_fetch(self, presences: List[dict]) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Determine which of a faction's systems need fetching.
+
+    That's those where the presence's `updated_at` is newer than our data,
+    plus any with a conflict whose data is from before the latest tick, as
+    it might since have moved on or ended.
+
+    :param presences: elitebgs.app API 'faction_presence' list.
+    :returns: (`list` of presences to fetch, `dict` of system name ->
+      systemaddress for those that don't need it)
+    """
+    known = self.db.systems_by_name(s['system_name'] for s in presences)
+
+    conflicted = set()
+    latest_tick = self.tick_timeline(
+      datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=1)
+    ).latest
+    if latest_tick is not None:
+      conflicted = {s.name for s in self.db.iter_systems_conflicts_older_than(latest_tick)}
+
+    to_fetch = []
+    unchanged = {}
+    for s in presences:
+      system = known.get(s['system_name'])
+      if (
+        system is None
+        or s['system_name'] in conflicted
+        or decode.parse_time(s['updated_at']) > system.last_updated.replace(tzinfo=datetime.timezone.utc)
+      ):
+        to_fetch.append(s)
+
+      else:
+        unchanged[s['system_name']] = system.systemaddress
+
+    return to_fetch, unchanged
+
   def faction_in_system(self, faction_name: str, system_id: int, data: dict) -> None:
     """
     Store information about the given faction in the given system.
@@ -123,17 +266,23 @@ class EliteBGS:
     }
     self.db.record_faction_presence(faction_id, set_data)
 
-  def factions_in_system(self, elitebgs_system_id: int, system_id: int, factions: dict) -> None:
+  def factions_in_system(
+    self, elitebgs_system_id: int, system_id: int, factions: dict,
+    conn: Optional['sqlalchemy.engine.base.Connection'] = None
+  ) -> None:
     """
     Store information about the given faction in the given system.
 
     :param elitebgs_system_id: EliteBGS's id for the system.
     :param system_id: Our DB id of the system.
     :param factions: elitebgs.app system factions dictionary.
+    :param conn: DB connection, if within a unit of work.
     """
+    faction_ids = self.db.record_factions([f['name'] for f in factions], conn=conn)
+
     fs = []
     for f in factions:
-      faction_id = self.faction_name_only(f['name'])
+      faction_id = faction_ids[f['name']]
 
       # It should be a single dict, not a list of dicts.
       if isinstance(f['faction_details']['faction_presence'], list):
@@ -158,7 +307,7 @@ class EliteBGS:
         }
       )
 
-    self.db.record_factions_presences(system_id, fs)
+    self.db.record_factions_presences(system_id, fs, conn=conn)
 
   def faction_name_only(self, faction_name: str) -> int:
     """
@@ -179,27 +328,105 @@ class EliteBGS:
     :param system_name: System to query.
     :returns: The system 'document'.
     """
+    system_data = self.fetch_system(system_name)
+    if system_data is None:
+      return None
+
+    # The whole system document is written through one connection, in one
+    # transaction, so we never end up with a half-recorded system.
+    with self.db.unit_of_work() as conn:
+      self.store_system(system_data, conn)
+
+      # Not coming via `faction()`, nothing else will sync the states.
+      faction_ids = self.db.record_factions([f['name'] for f in system_data['factions']], conn=conn)
+      for f in system_data['factions']:
+        presence = f['faction_details']['faction_presence']
+        if isinstance(presence, dict):
+          self.db.record_faction_states(
+            faction_ids[f['name']], {system_data['system_address']: self.presence_states(presence)}, conn=conn
+          )
+
+    self.run_systems[system_name] = system_data['system_address']
+
+    return system_data
+
+  def fetch_systems(
+    self, system_names: Iterable[str], newer_than: Optional[Dict[str, datetime.datetime]] = None
+  ) -> Iterator[Optional[dict]]:
+    """
+    Retrieve data about the specified systems, up to `max_workers` at once.
+
+    :param system_names: Systems to query.
+    :param newer_than: Optional `dict` of system name -> when its data is
+      known to have changed, see `fetch_system()`.
+    :returns: The system 'document's, or `None` on error, in the given order.
+    """
+    changed = newer_than or {}
+
+    def fetch(system_name: str) -> Optional[dict]:
+      return self.fetch_system(system_name, newer_than=changed.get(system_name))
+
+    if self.max_workers == 1:
+      yield from map(fetch, system_names)
+      return
+
+    executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='elitebgs')
+    try:
+      yield from executor.map(fetch, system_names)
+
+    finally:
+      # If we're abandoned part way through don't fetch the rest.
+      executor.shutdown(wait=False, cancel_futures=True)
+
+  def fetch_system(self, system_name: str, newer_than: Optional[datetime.datetime] = None) -> Optional[dict]:
+    """
+    Retrieve available data about the specified system.
+
+    :param system_name: System to query.
+    :param newer_than: When the system's data is known to have changed, so
+      a response cached before then isn't used.
+    :returns: The system 'document'.
+    """
     try:
-      r = self.session.get(
-        f'{self.SYSTEMS_URL}?name={system_name}&factionDetails=true'
+      content = self.get(
+        f'{self.systems_url}?name={system_name}&factionDetails=true',
+        newer_than=newer_than,
       )
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
       self.logger.warning(f'Error retrieving system {system_name}: {e!r}')
       return None
 
-    # print(r.content.decode())
+    # print(content.decode())
 
     try:
-      data = r.json()
+      data = decode.loads(content)
       system_data = data['docs'][0]
 
-    except json.JSONDecodeError as e:
+    except decode.JSONDecodeError as e:
       self.logger.warning(f'Error decoding JSON for system {system_name}: {e!r}')
       return None
 
+    return system_data
+
+  def store_system(self, system_data: dict, conn: 'sqlalchemy.engine.base.Connection') -> None:
+    """
+    Store an elitebgs.app system document.
+
+    :param system_data: The system 'document'.
+    :param conn: DB connection from `Database.unit_of_work()`.
+    """
+    # Resolve every faction this document mentions in one go, so that the
+    # per-faction and per-conflict recording below only hits the registry.
+    faction_names = [system_data['controlling_minor_faction_cased']]
+    faction_names.extend(f['name'] for f in system_data['factions'])
+    for c in system_data['conflicts']:
+      faction_names.extend((c['faction1']['name'], c['faction2']['name']))
+
+    faction_ids = self.db.record_factions(faction_names, conn=conn)
+
     # Record the controlling faction
-    controlling_faction_id = self.db.record_faction(system_data['controlling_minor_faction_cased'])
+    controlling_faction_id = faction_ids[system_data['controlling_minor_faction_cased']]
     # self.logger.debug(f'Recorded controlling faction {system_data["controlling_minor_faction_cased"]}'
     #                   f' under id {controlling_faction_id}')
 
@@ -217,16 +444,19 @@ class EliteBGS:
       'system_security':            system_data['security'],
       'last_updated':               system_data['updated_at'],
     }
-    system = self.db.record_system(system_db)
+    system = self.db.record_system(system_db, conn=conn)
 
     # Now we have the system, record *all* the factions present in it
     self.factions_in_system(
       system_data['_id'],
       system['systemaddress'],
       system_data['factions'],
+      conn=conn,
     )
 
-    return system_data
+    # And any conflicts in it
+    for c in system_data['conflicts']:
+      self.db.record_conflict(system['systemaddress'], system_data['updated_at'], c, conn=conn)
 
   def last_tick(self) -> Optional[datetime.datetime]:
     """
@@ -235,24 +465,29 @@ class EliteBGS:
     :returns: `datetime.datetime` of latest tick, on success, else `None`.
     """
     try:
-      r = self.session.get(
-        self.TICKS_URL,
+      content = self.get(
+        self.ticks_url,
+        ticks=True,
       )
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
       self.logger.warning(f'Error retrieving tick: {e!r}')
       return None
 
     try:
-      data = r.json()
+      data = decode.loads(content)
 
-    except json.JSONDecodeError as e:
+    except decode.JSONDecodeError as e:
       self.logger.warning(f'Error decoding JSON for tick: {e!r}')
       return None
 
     # [{"_id":"60d266ede6bdf9696a4e0cc8","time":"2021-06-22T22:15:43.000Z","updated_at":"2021-06-22T22:40:45.726Z","__v":0}]
-    self.logger.debug(f'Returning: isoparse("{data[0]["time"]}")')
-    return isoparse(data[0]['time'])
+    last_tick = decode.parse_time(data[0]['time'])
+    self.logger.debug(f'Returning: {last_tick}')
+    if self.cache is not None:
+      self.cache.last_tick = last_tick
+
+    return last_tick
 
   def ticks_since(self, since: datetime.datetime) -> Optional[list]:
     """
@@ -263,27 +498,58 @@ class EliteBGS:
     """
     self.logger.debug(f'{since=}')
     timemin = int(since.timestamp()) * 1000
-    url = f'{self.TICKS_URL}?timeMin={timemin}'
+    url = f'{self.ticks_url}?timeMin={timemin}'
     try:
-      r = self.session.get(
+      content = self.get(
         url,
+        ticks=True,
       )
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
       self.logger.warning(f'Error retrieving ticks: {e!r}')
       return None
 
     try:
-      data = r.json()
+      data = decode.loads(content)
 
-    except json.JSONDecodeError as e:
+    except decode.JSONDecodeError as e:
       self.logger.warning(f'Error decoding JSON for ticks: {e!r}')
       return None
 
     ticks = []
     for t in data:
-      self.logger.debug(f'Including tick "{isoparse(t["time"])}"')
-      ticks.append(isoparse(t['time']))
+      tick = decode.parse_time(t['time'])
+      self.logger.debug(f'Including tick "{tick}"')
+      ticks.append(tick)
 
     # self.logger.debug(f'Returning ticks:\n{ticks}\n')
     return ticks
+
+  def tick_timeline(self, since: datetime.datetime) -> TickTimeline:
+    """
+    Bring our recorded ticks up to date, and return them all as a timeline.
+
+    Only ticks newer than the latest recorded one are requested, unless those
+    recorded don't reach back as far as `since`.
+
+    :param since: Oldest time of ticks to consider.
+    :returns: `TickTimeline` of all known ticks.
+    """
+    timeline = TickTimeline(self.db.ticks_since())
+    fetch_since = since
+    if timeline.latest is not None and timeline.covers(since):
+      fetch_since = timeline.latest
+
+    new_ticks = self.ticks_since(fetch_since)
+    if new_ticks is None:
+      self.logger.warning('Unable to retrieve new ticks, using only those already recorded')
+
+    else:
+      self.db.record_ticks(new_ticks)
+      timeline.add(new_ticks)
+
+    if self.cache is not None:
+      # Anything fetched before the latest tick is now stale.
+      self.cache.last_tick = timeline.latest
+
+    return timeline
@@ -0,0 +1,2 @@
+"""Local routing around systems."""
+from ed_bgs.route.route import RouteSolver  # noqa: F401
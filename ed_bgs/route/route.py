@@ -0,0 +1,212 @@
+"""
+Plan a tourist route around systems, locally, from their star positions.
+
+Unlike asking spansh.co.uk, this gives a visit order straight away, and
+works offline.  It's a heuristic, not an optimal, route: nearest neighbour
+to start with, then improved with 2-opt and Or-opt moves until neither
+finds anything better.
+
+Legs cost their straight line distance or, given a jump range, roughly how
+many jumps they'll take.  That assumes there's always a star to jump to,
+so it's an under-estimate in sparse regions.
+"""
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+import numpy
+
+# isort off
+if TYPE_CHECKING:
+  import logging
+
+  import ed_bgs.database as database
+# isort on
+
+
+class RouteSolver:
+  """Order systems into a short route from a start system."""
+
+  # Improvements smaller than this are just floating point noise.
+  EPSILON = 1e-9
+
+  def __init__(
+    self, logger: 'logging.Logger', jump_range: Optional[float] = None, loop: bool = False,
+    max_passes: int = 100
+  ):
+    """
+    Initialise the solver.
+
+    :param logger: `logging.Logger` instance.
+    :param jump_range: Ship laden jump range, to cost legs by jumps, not distance.
+    :param loop: Whether the route has to return to the start system.
+    :param max_passes: Limit on improvement passes.
+    """
+    self.logger = logger
+    self.jump_range = jump_range
+    self.loop = loop
+    self.max_passes = max_passes
+
+  def costs(self, positions: numpy.ndarray) -> numpy.ndarray:
+    """
+    Calculate the cost of travelling between every pair of positions.
+
+    :param positions: (n, 3) array of star positions.
+    :returns: (n, n) cost matrix.
+    """
+    distances = numpy.sqrt(((positions[:, None, :] - positions[None, :, :]) ** 2).sum(axis=-1))
+    if self.jump_range is None:
+      return distances
+
+    # Distance only breaks ties between legs of the same number of jumps.
+    return numpy.ceil(distances / self.jump_range) + distances * 1e-6
+
+  def _end_costs(self, costs: numpy.ndarray) -> numpy.ndarray:
+    """
+    Add a fixed end to the cost matrix.
+
+    For a loop it's the start again, otherwise it costs nothing to reach
+    from anywhere, so the route can end wherever is best.  Either way the
+    route is then a path between two fixed ends.
+    """
+    n = len(costs)
+    extended = numpy.zeros((n + 1, n + 1))
+    extended[:n, :n] = costs
+    if self.loop:
+      extended[:n, n] = costs[:, 0]
+      extended[n, :n] = costs[0, :]
+
+    return extended
+
+  def _nearest_neighbour(self, costs: numpy.ndarray) -> List[int]:
+    """Build a route from 0 by always going to the nearest unvisited."""
+    n = len(costs) - 1
+    unvisited: numpy.ndarray = numpy.ones(n, dtype=bool)
+    unvisited[0] = False
+    route = [0]
+    for _ in range(n - 1):
+      leg = numpy.where(unvisited, costs[route[-1], :n], numpy.inf)
+      nearest = int(leg.argmin())
+      unvisited[nearest] = False
+      route.append(nearest)
+
+    return route + [n]
+
+  def _two_opt(self, route: List[int], costs: numpy.ndarray) -> bool:
+    """
+    Reverse sections of the route wherever that shortens it.
+
+    :param route: The route, including both fixed ends, changed in place.
+    :param costs: Cost matrix including the end.
+    :returns: Whether any improvement was made.
+    """
+    improved = False
+    r = numpy.array(route)
+    for i in range(1, len(r) - 2):
+      a, b = r[i - 1], r[i]
+      c, d = r[i + 1:-1], r[i + 2:]
+      delta = costs[a, c] + costs[b, d] - costs[a, b] - costs[c, d]
+      j = int(delta.argmin())
+      if delta[j] < -self.EPSILON:
+        r[i:i + j + 2] = r[i:i + j + 2][::-1].copy()
+        improved = True
+
+    route[:] = r.tolist()
+    return improved
+
+  def _or_opt(self, route: List[int], costs: numpy.ndarray) -> bool:
+    """
+    Move short runs of systems, possibly reversed, to wherever is cheapest.
+
+    :param route: The route, including both fixed ends, changed in place.
+    :param costs: Cost matrix including the end.
+    :returns: Whether any improvement was made.
+    """
+    improved = False
+    for k in (1, 2, 3):
+      i = 1
+      while i + k < len(route):
+        segment = route[i:i + k]
+        p, q = route[i - 1], route[i + k]
+        saved = costs[p, segment[0]] + costs[segment[-1], q] - costs[p, q]
+
+        rest = numpy.array(route[:i] + route[i + k:])
+        x, y = rest[:-1], rest[1:]
+        forward = costs[x, segment[0]] + costs[segment[-1], y] - costs[x, y]
+        backward = costs[x, segment[-1]] + costs[segment[0], y] - costs[x, y]
+        best = numpy.minimum(forward, backward)
+        j = int(best.argmin())
+        if best[j] < saved - self.EPSILON:
+          if backward[j] < forward[j]:
+            segment = segment[::-1]
+
+          route[:] = rest[:j + 1].tolist() + segment + rest[j + 1:].tolist()
+          improved = True
+
+        i += 1
+
+    return improved
+
+  def solve(self, positions: numpy.ndarray) -> List[int]:
+    """
+    Find a short route through positions, starting from the first.
+
+    :param positions: (n, 3) array of star positions, the start first.
+    :returns: Indices of the positions, in visit order, starting with 0.
+    """
+    if len(positions) < 3:
+      return list(range(len(positions)))
+
+    costs = self._end_costs(self.costs(positions))
+    route = self._nearest_neighbour(costs)
+    for passes in range(1, self.max_passes + 1):
+      if not (self._two_opt(route, costs) | self._or_opt(route, costs)):
+        break
+
+    self.logger.debug(f'Route improved in {passes} passes')
+
+    return route[:-1]
+
+  def route(self, db: 'database.Database', start: str, systems: Iterable[str]) -> Optional[List[dict]]:
+    """
+    Plan a route around systems, using their stored star positions.
+
+    Any system without a known position is left out, with a warning.
+
+    :param db: `ed_bgs.Database` instance.
+    :param start: Name of the system to start from.
+    :param systems: Names of the systems to visit.
+    :returns: `list` of `dict` with 'name', 'distance' (light years, from the
+      previous system) and 'jumps' (if we have a jump range), one per
+      system in visit order, starting with `start`.  Or `None` if the start
+      system's position isn't known.
+    """
+    names = [start] + [s for s in dict.fromkeys(systems) if s != start]
+    known = db.systems_by_name(names, columns=('starpos_x', 'starpos_y', 'starpos_z'))
+    if start not in known or known[start].starpos_x is None:
+      self.logger.warning(f'No known position for start system: {start}')
+      return None
+
+    missing = [n for n in names if n not in known or known[n].starpos_x is None]
+    for n in missing:
+      self.logger.warning(f'No known position for system, leaving it out: {n}')
+
+    names = [n for n in names if n not in missing]
+    positions = numpy.array([[known[n].starpos_x, known[n].starpos_y, known[n].starpos_z] for n in names])
+
+    order = self.solve(positions)
+    if self.loop:
+      order.append(0)
+
+    legs = []
+    previous = order[0]
+    for i in order:
+      distance = float(numpy.linalg.norm(positions[i] - positions[previous]))
+      legs.append(
+        {
+          'name': names[i],
+          'distance': distance,
+          'jumps': int(numpy.ceil(distance / self.jump_range)) if self.jump_range is not None else None,
+        }
+      )
+      previous = i
+
+    return legs
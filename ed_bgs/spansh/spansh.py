@@ -5,6 +5,8 @@ from typing import TYPE_CHECKING, List, Optional, Tuple
 
 import requests
 
+from ed_bgs.client import HttpClient
+
 # isort off
 if TYPE_CHECKING:
   import logging
@@ -17,15 +19,20 @@ class Spansh:
   TOURIST_URL = 'https://www.spansh.co.uk/api/tourist/route'
   TOURIST_RESULT_PREFIX = 'https://www.spansh.co.uk/tourist/results/'
 
-  def __init__(self, logger: 'logging.Logger'):
+  def __init__(self, logger: 'logging.Logger', client: Optional[HttpClient] = None):
     """
     Initialise access to spansh.co.uk APIs.
 
     :param logger: `logging.Logger` instance.
+    :param client: `HttpClient` to make requests with, possibly shared with
+      other APIs, else one is made with default limits.
     """
     self.logger = logger
 
-    self.session = requests.Session()
+    if client is None:
+      client = HttpClient(logger)
+
+    self.client = client
 
   def tourist_route(self, start: str, range: float, systems: list, loop: bool = False) -> Optional[str]:
     """
@@ -52,12 +59,13 @@ class Spansh:
     # self.logger.debug(f'data for tourist route query:\n{data}\n')
 
     try:
-      r = self.session.post(
+      r = self.client.post(
         self.TOURIST_URL,
         data,
       )
+      r.raise_for_status()
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
       self.logger.warning(f'Error requesting the route: {e!r}')
       return None
 
@@ -2,25 +2,17 @@
 """Identify systems with stale data."""
 
 import argparse
-import json
 import logging
 import os
 import sys
 import time
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 import yaml
-from dateutil.parser import isoparse
 
 import ed_bgs
 
-"""
- " Configuration
-"""
-__configfile_fd = os.open("ed-bgs_config.yaml", os.O_RDONLY)
-__configfile = os.fdopen(__configfile_fd)
-config = yaml.load(__configfile, Loader=yaml.CLoader)
-
 """
  " Logging
 """
@@ -40,83 +32,218 @@ logger.addHandler(__logger_ch)
 """
  " Command-Line Arguments
 """
-__parser = argparse.ArgumentParser()
-__parser.add_argument(
-  '--loglevel',
-  help='set the log level to one of: DEBUG, INFO (default), WARNING, ERROR, CRITICAL'
-)
-
-__age_args = __parser.add_mutually_exclusive_group(required=True)
-__age_args.add_argument(
-  '--age',
-  type=int, help='How many hours ago is considered outdated.'
-)
-__age_args.add_argument(
-  '--tick-plus',
-  type=float, help='How many hours to add to last tick time to use as max age.'
-)
-
-__datasource = __parser.add_mutually_exclusive_group(required=True)
-__datasource.add_argument(
-  '--jsonfilename',
-  help='Name of file containing elitebgs.app API output to process'
-)
-__datasource.add_argument(
-  '--faction',
-  help='Name of the Minor Faction to report on.'
-)
-
-# We just want to be sure *all* the systems are up to date.
-__parser.add_argument(
-  '--all-systems',
-  action='store_true',
-  help='Consider ALL systems.'
-)
-
-# Selection of heuristics
-__parser.add_argument(
-  '--active-conflicts',
-  action='store_true',
-  help='Consider any system with a known conflict.'
-)
-__parser.add_argument(
-  '--possible-losing-conflicts',
-  action='store_true',
-  help='Consider any system so old we could now be in a 0:3 conflict state.'
-)
-__parser.add_argument(
-  '--danger-of-conflicts',
-  action='store_true',
-  help='Consider any system that could now be one tick away from a pending conflict.'
-)
-
-__spansh_sub = __parser.add_subparsers(
-  title='Optional commands',
-  description='Additional commands that may allow, or require, additional arguments.'
-)
-__spansh = __spansh_sub.add_parser(
-  'spansh-route',
-  help='Generate a spansh tourist route, requires additional arguments.'
-)
-__spansh.add_argument(
-  '--range',
-  type=float,
-  required=True,
-  help='Ship max jump range for routing'
-)
-__spansh.add_argument(
-  '--start-system',
-  type=str,
-  required=True,
-  help='Start system for tourist route'
-)
-
-
-args = __parser.parse_args()
-if args.loglevel:
-  level = getattr(logging, args.loglevel.upper())
-  logger.setLevel(level)
-  __logger_ch.setLevel(level)
+
+
+def argument_parser() -> argparse.ArgumentParser:
+  """
+  Build the command-line argument parser.
+
+  :returns: The parser.
+  """
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    '--loglevel',
+    help='set the log level to one of: DEBUG, INFO (default), WARNING, ERROR, CRITICAL'
+  )
+
+  age_args = parser.add_mutually_exclusive_group(required=True)
+  age_args.add_argument(
+    '--age',
+    type=int, help='How many hours ago is considered outdated.'
+  )
+  age_args.add_argument(
+    '--tick-plus',
+    type=float, help='How many hours to add to last tick time to use as max age.'
+  )
+
+  datasource = parser.add_mutually_exclusive_group(required=True)
+  datasource.add_argument(
+    '--jsonfilename',
+    action='append',
+    help='A file, or directory of them, containing elitebgs.app factions API output to process.'
+         '  It may be gzip or zstd compressed.  Repeat for more than one.'
+  )
+  datasource.add_argument(
+    '--faction',
+    help='Name of the Minor Faction to report on.'
+  )
+  datasource.add_argument(
+    '--all-monitored',
+    action='store_true',
+    help='Report on all the monitor_factions, in one pass, with one merged list of systems.'
+  )
+
+  # We just want to be sure *all* the systems are up to date.
+  parser.add_argument(
+    '--all-systems',
+    action='store_true',
+    help='Consider ALL systems.'
+  )
+
+  # Selection of heuristics
+  parser.add_argument(
+    '--active-conflicts',
+    action='store_true',
+    help='Consider any system with a known conflict.'
+  )
+  parser.add_argument(
+    '--possible-losing-conflicts',
+    action='store_true',
+    help='Consider any system so old we could now be in a 0:3 conflict state.'
+  )
+  parser.add_argument(
+    '--danger-of-conflicts',
+    action='store_true',
+    help='Consider any system that could now be one tick away from a pending conflict.'
+  )
+
+  routes = parser.add_subparsers(
+    title='Optional commands',
+    description='Additional commands that may allow, or require, additional arguments.'
+  )
+  spansh = routes.add_parser(
+    'spansh-route',
+    help='Generate a spansh tourist route, requires additional arguments.'
+  )
+  spansh.set_defaults(route='spansh')
+  spansh.add_argument(
+    '--range',
+    type=float,
+    required=True,
+    help='Ship max jump range for routing'
+  )
+  spansh.add_argument(
+    '--start-system',
+    type=str,
+    required=True,
+    help='Start system for tourist route'
+  )
+  local = routes.add_parser(
+    'local-route',
+    help='Plan a tourist route locally, from known star positions, without spansh.'
+  )
+  local.set_defaults(route='local')
+  local.add_argument(
+    '--start-system',
+    type=str,
+    required=True,
+    help='Start system for tourist route'
+  )
+  local.add_argument(
+    '--range',
+    type=float,
+    help='Ship max jump range, to minimise jumps rather than distance'
+  )
+  local.add_argument(
+    '--loop',
+    action='store_true',
+    help='Route back to the start system'
+  )
+
+  return parser
+
+
+def faction_systems(
+  bgs: ed_bgs.BGS, faction_id: int, since: datetime, context: Optional[ed_bgs.bgs.AnalysisContext]
+) -> list:
+  """
+  Run the selected heuristics for a faction.
+
+  :param bgs: `ed_bgs.BGS` instance.
+  :param faction_id: Our DB id of the faction.
+  :param since: `datetime` of newest data that's OK.
+  :param context: `AnalysisContext` covering the faction, else each
+    heuristic queries for itself.
+  :returns: Names of systems to be updated, possibly with duplicates.
+  """
+  if args.all_systems:
+    logger.debug(f'all-systems for {faction_id=}')
+    return bgs.systems_outdated(faction_id, since, context=context)
+
+  systems = []
+  if args.active_conflicts:
+    logger.info('Checking for stale systems with known active conflicts...')
+    systems.extend(bgs.active_conflicts_needing_update(faction_id, since, context=context))
+
+  if args.possible_losing_conflicts:
+    logger.info('Checking for stale systems with possible losing active conflicts...')
+    systems.extend(
+      bgs.possible_losing_conflicts(since, faction_id=faction_id, tick_plus=args.tick_plus, context=context)
+    )
+
+  # Anywhere that was last seen with 'close' inf% to another MF and not
+  # updated this tick.
+  if args.danger_of_conflicts:
+    logger.info('Checking for stale systems with possible active conflicts...')
+    systems.extend(bgs.stale_danger_of_conflicts(since, faction_id, context=context))
+
+  return systems
+
+
+def monitored_systems(db: ed_bgs.Database, bgs: ed_bgs.BGS, since: datetime) -> list:
+  """
+  Run the selected heuristics for all the monitored factions, in one pass.
+
+  The results are printed per faction as we go.
+
+  :param db: `ed_bgs.Database` instance.
+  :param bgs: `ed_bgs.BGS` instance.
+  :param since: `datetime` of newest data that's OK.
+  :returns: Names of systems to be updated, for any faction.
+  """
+  faction_ids = {}
+  for f in config['monitor_factions']:
+    faction_id = db.faction_id_from_name(f)
+    if faction_id is None:
+      logger.warning(f'Unknown monitored faction: {f} - CASE MATTERS!')
+      continue
+
+    faction_ids[f] = faction_id
+
+  # One set of queries covers all the factions.
+  context = bgs.analysis_context(
+    faction_ids.values(), since, tick_plus=args.tick_plus if args.possible_losing_conflicts else None
+  )
+
+  systems = []
+  for f, faction_id in faction_ids.items():
+    logger.info(f'Checking faction: {f} ...')
+    f_systems = sorted(set(faction_systems(bgs, faction_id, since, context)))
+    print(f'\n{f}: {len(f_systems)} systems to be updated')
+    for s in f_systems:
+      print(f'  {s}')
+
+    systems.extend(f_systems)
+
+  return systems
+
+
+def print_local_route(db: ed_bgs.Database, systems: list) -> int:
+  """
+  Plan, and print, a tourist route around systems locally.
+
+  :param db: `ed_bgs.Database` instance.
+  :param systems: Names of systems to be updated.
+  :returns: Exit code.
+  """
+  solver = ed_bgs.RouteSolver(logger, jump_range=args.range, loop=args.loop)
+  route = solver.route(db, args.start_system, systems)
+  if route is None:
+    return -4
+
+  print('\n\nTourist route:')
+  for i, leg in enumerate(route):
+    jumps = f' {leg["jumps"]:>3} jumps' if leg['jumps'] is not None else ''
+    print(f'{i:>3} {leg["name"]:30} {leg["distance"]:>9.2f} ly{jumps}')
+
+  total = sum(leg['distance'] for leg in route)
+  if args.range is not None:
+    print(f'Total: {total:.2f} ly, {sum(leg["jumps"] for leg in route)} jumps')
+
+  else:
+    print(f'Total: {total:.2f} ly')
+
+  return 0
 
 
 def main() -> int:  # noqa: CCR001
@@ -125,13 +252,25 @@ def main() -> int:  # noqa: CCR001
 
   :returns: Exit code.
   """
-  db = ed_bgs.Database(config['database']['url'], logger)
-  ebgs = ed_bgs.EliteBGS(logger, db)
+  db = ed_bgs.Database(
+    config['database']['url'],
+    logger,
+    schema=config['database'].get('schema', 'create'),
+  )
+  # Shared by all the APIs, each host still gets its own limits.
+  client = ed_bgs.HttpClient.from_config(logger, config.get('http'))
+  ebgs = ed_bgs.EliteBGS(
+    logger,
+    db,
+    cache=ed_bgs.elitebgs_app.ResponseCache.from_config(logger, config.get('elitebgs', {}).get('cache')),
+    client=client,
+    base_url=config.get('elitebgs', {}).get('base_url', ed_bgs.EliteBGS.API_URL),
+  )
   bgs = ed_bgs.BGS(logger, db, ebgs)
 
   tourist_systems = []
   if args.tick_plus is not None:
-    last_tick = ebgs.last_tick()
+    last_tick = bgs.tick_timeline(datetime.now(tz=timezone.utc) - timedelta(days=1)).latest
     logger.info(f'Last tick allegedly around: {last_tick}')
     since = last_tick + timedelta(hours=args.tick_plus)
 
@@ -147,13 +286,11 @@ def main() -> int:  # noqa: CCR001
 
   if args.jsonfilename:
     logger.info('Using provided static file data...')
-    with open(args.jsonfilename, 'r', encoding='utf-8') as f:
-      j = json.load(f)
-      data = j['docs'][0]
+    dump = ed_bgs.elitebgs_app.DumpReader(logger)
 
     # We only have static file data, so do the simple check.
-    for s in data['faction_presence']:
-      updated = isoparse(s['updated_at'])
+    for s in dump.presences(args.jsonfilename):
+      updated = ed_bgs.elitebgs_app.decode.parse_time(s['updated_at'])
       if (updated < since):
         # print(f'{s["system_name"]:30} {updated}')
         tourist_systems.append(s['system_name'])
@@ -166,24 +303,21 @@ def main() -> int:  # noqa: CCR001
       logger.error(f'Unknown faction: {args.faction} - CASE MATTERS!')
       return -3
 
-    if args.all_systems:
-      logger.debug(f'all-systems for {args.faction=}')
-      tourist_systems.extend(bgs.systems_outdated(faction_id, since))
+    # What the checks need, gathered once, as they first need it.  For just
+    # the names, for one faction, they're better streamed straight from the
+    # database.
+    context = None
+    if not args.all_systems:
+      context = bgs.analysis_context(
+        [faction_id], since, tick_plus=args.tick_plus if args.possible_losing_conflicts else None
+      )
 
-    else:
-      if args.active_conflicts:
-        logger.info('Checking for stale systems with known active conflicts...')
-        tourist_systems.extend(bgs.active_conflicts_needing_update(faction_id, since))
+    tourist_systems.extend(faction_systems(bgs, faction_id, since, context))
 
-      if args.possible_losing_conflicts:
-        logger.info('Checking for stale systems with possible losing active conflicts...')
-        tourist_systems.extend(bgs.possible_losing_conflicts(since, faction_id=faction_id, tick_plus=args.tick_plus))
+  elif args.all_monitored:
+    logger.info('Using current local data, for all monitored factions ...')
 
-      # Anywhere that was last seen with 'close' inf% to another MF and not
-      # updated this tick.
-      if args.danger_of_conflicts:
-        logger.info('Checking for stale systems with possible active conflicts...')
-        tourist_systems.extend(bgs.stale_danger_of_conflicts(since, faction_id))
+    tourist_systems.extend(monitored_systems(db, bgs, since))
 
   else:
     logger.error("No data source was specified?")
@@ -193,11 +327,15 @@ def main() -> int:  # noqa: CCR001
   tourist_systems = list(set(tourist_systems))
 
   if len(tourist_systems) > 0:
-    if hasattr(args, 'range') and hasattr(args, 'start_system'):
-      spansh = ed_bgs.Spansh(logger)
+    route = getattr(args, 'route', None)
+    if route == 'spansh':
+      spansh = ed_bgs.Spansh(logger, client=client)
       route_url = spansh.tourist_route(args.start_system, args.range, tourist_systems, False)
       print(route_url)
 
+    elif route == 'local':
+      return print_local_route(db, tourist_systems)
+
     else:
       print('\n\nSystems to be updated:')
       for s in tourist_systems:
@@ -211,4 +349,16 @@ def main() -> int:  # noqa: CCR001
 
 
 if __name__ == '__main__':
+  # Configuration
+  __configfile_fd = os.open("ed-bgs_config.yaml", os.O_RDONLY)
+  __configfile = os.fdopen(__configfile_fd)
+  config = yaml.load(__configfile, Loader=yaml.CLoader)
+
+  # Command-line arguments
+  args = argument_parser().parse_args()
+  if args.loglevel:
+    level = getattr(logging, args.loglevel.upper())
+    logger.setLevel(level)
+    __logger_ch.setLevel(level)
+
   sys.exit(main())
@@ -0,0 +1 @@
+"""Tests, run with `python -m unittest discover -s tests -t .` from the top of the repository."""
@@ -0,0 +1,51 @@
+"""Tests for the systems-outdated.py command-line arguments."""
+import importlib.util
+import os
+import unittest
+
+__script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'systems-outdated.py')
+__spec = importlib.util.spec_from_file_location('systems_outdated', __script)
+assert __spec is not None and __spec.loader is not None
+systems_outdated = importlib.util.module_from_spec(__spec)
+__spec.loader.exec_module(systems_outdated)
+
+
+class TestArgumentParser(unittest.TestCase):
+  """Check the arguments parse as documented."""
+
+  def setUp(self) -> None:
+    """Build a fresh parser for each test."""
+    self.parser = systems_outdated.argument_parser()
+
+  def test_jsonfilename_repeated(self) -> None:
+    """Each --jsonfilename adds one file."""
+    args = self.parser.parse_args(['--age', '24', '--jsonfilename', 'a.json', '--jsonfilename', 'b.json.gz'])
+    self.assertEqual(args.jsonfilename, ['a.json', 'b.json.gz'])
+
+  def test_jsonfilename_with_spansh_route(self) -> None:
+    """A route subcommand after --jsonfilename isn't taken as another file."""
+    args = self.parser.parse_args(
+      ['--age', '24', '--jsonfilename', 'dump', 'spansh-route', '--range', '30', '--start-system', 'Sol']
+    )
+    self.assertEqual(args.jsonfilename, ['dump'])
+    self.assertEqual(args.route, 'spansh')
+    self.assertEqual(args.range, 30.0)
+    self.assertEqual(args.start_system, 'Sol')
+
+  def test_jsonfilename_with_local_route(self) -> None:
+    """As for spansh-route, with the local planner."""
+    args = self.parser.parse_args(
+      ['--tick-plus', '2', '--jsonfilename', 'dump', 'local-route', '--start-system', 'Sol', '--loop']
+    )
+    self.assertEqual(args.jsonfilename, ['dump'])
+    self.assertEqual(args.route, 'local')
+    self.assertTrue(args.loop)
+
+  def test_one_datasource(self) -> None:
+    """--jsonfilename can't be combined with another data source."""
+    with self.assertRaises(SystemExit):
+      self.parser.parse_args(['--age', '24', '--jsonfilename', 'dump', '--all-monitored'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,8 +6,10 @@ It may then go on to generate various reports.
 """
 
 import argparse
+import datetime
 import logging
 import os
+import signal
 import time
 import sys
 
@@ -43,6 +45,21 @@ logger.addHandler(__logger_ch)
 """
 __parser = argparse.ArgumentParser()
 __parser.add_argument('--loglevel', help='set the log level to one of: DEBUG, INFO (default), WARNING, ERROR, CRITICAL')
+__parser.add_argument(
+  '--incremental',
+  action='store_true',
+  help='Only fetch systems that elitebgs.app has newer data for, or with conflicts to update.'
+)
+__parser.add_argument(
+  '--daemon',
+  action='store_true',
+  help='Keep running, incrementally updating in waves after each tick, see the daemon: config.'
+)
+__parser.add_argument(
+  '--budget',
+  type=int,
+  help='Only fetch this many systems, those whose data is most urgently needed.'
+)
 args = __parser.parse_args()
 if args.loglevel:
   level = getattr(logging, args.loglevel.upper())
@@ -57,10 +74,53 @@ def main() -> int:
   :returns: Exit code.
   """
   logger.info('Initialising Database Connection')
-  db = ed_bgs.Database(config['database']['url'], logger)
+  db = ed_bgs.Database(
+    config['database']['url'],
+    logger,
+    schema=config['database'].get('schema', 'create'),
+  )
+
+  ebgs = ed_bgs.EliteBGS(
+    logger,
+    db,
+    max_workers=config.get('elitebgs', {}).get('max_workers', 1),
+    cache=ed_bgs.elitebgs_app.ResponseCache.from_config(logger, config.get('elitebgs', {}).get('cache')),
+    client=ed_bgs.HttpClient.from_config(logger, config.get('http')),
+    base_url=config.get('elitebgs', {}).get('base_url', ed_bgs.EliteBGS.API_URL),
+  )
+  if args.daemon:
+    daemon_config = config.get('daemon', {})
+    daemon = ed_bgs.UpdateDaemon(
+      logger,
+      db,
+      ebgs,
+      config['monitor_factions'],
+      poll_interval=datetime.timedelta(minutes=daemon_config.get('poll_minutes', 5)),
+      spread=datetime.timedelta(hours=daemon_config.get('spread_hours', 6)),
+      waves=daemon_config.get('waves', 6),
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+    daemon.run()
+    return 0
+
+  if args.budget is not None:
+    bgs = ed_bgs.BGS(logger, db, ebgs)
+    scheduler = ed_bgs.bgs.RefreshScheduler(logger, db, bgs, weights=config.get('scheduler', {}).get('weights'))
+    faction_ids = [db.faction_id_from_name(f) for f in config['monitor_factions']]
+    systems = scheduler.top([f for f in faction_ids if f is not None], args.budget)
+    logger.info(f'Fetching the {len(systems)} most urgent systems, of a budget of {args.budget}')
+
+    ebgs.start_run()
+    for s in systems:
+      ebgs.system(s)
+
+    ec = db.expire_conflicts()
+    logger.info(f'Expired {ec} conflicts.')
+    return 0
 
-  ebgs = ed_bgs.EliteBGS(logger, db)
   # return None
+  ebgs.start_run()
   # Looping over monitored factions
   for f in config['monitor_factions']:
     logger.info(f'Checking faction: {f} ...')
@@ -68,9 +128,11 @@ def main() -> int:
     # The deeper code takes care of recording all the necessary data to
     # know about the systems this faction is present in, other factions
     # involved in conflicts, and conflict data.
-    ebgs.faction(f)
+    ebgs.faction(f, incremental=args.incremental)
     logger.info(f'Checking faction: {f} DONE')
 
+  logger.info(f'Saved {ebgs.fetches_saved} system fetches already made for other factions.')
+
   # Expire any conflict that has ended more than a day ago
   ec = db.expire_conflicts()
   logger.info(f'Expired {ec} conflicts.')